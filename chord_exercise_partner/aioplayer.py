@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""Backing track player running as an asyncio task.
+
+Requires Python 3.5.2 or newer (for loop.create_future()).
+"""
+
+import asyncio
+import threading
+import time
+
+from .player import IDLE_TIMEOUT, CompPlayer, _precise_time
+
+# how long before an event the timer wakes up to wait for it actively
+SPIN_WINDOW = 0.001 # seconds
+
+def _set_done(future):
+    """Complete a future, unless already done."""
+    if not future.done():
+        future.set_result(None)
+
+class AsyncioWait:
+    """Deadline-aware asyncio timer.
+
+    Sleeps with the event loop timer until shortly before the deadline
+    and then yields to the loop until the deadline passes, so other
+    tasks can run while waiting. wake() may be called from any thread.
+    """
+    name = "asyncio"
+
+    def __init__(self, loop, spin_window=SPIN_WINDOW):
+        self.loop = loop
+        self.spin_window = spin_window
+        self.future = None
+        self.woken = False
+
+    async def wait_until(self, deadline):
+        """Wait until the deadline (a time.perf_counter() time) or wake()."""
+        delay = deadline - time.perf_counter() - self.spin_window
+        if delay > 0 and not self.woken:
+            self.future = self.loop.create_future()
+            handle = self.loop.call_later(delay, _set_done, self.future)
+            try:
+                await self.future
+            finally:
+                handle.cancel()
+                self.future = None
+        while not self.woken and time.perf_counter() < deadline:
+            await asyncio.sleep(0)
+        self.woken = False
+
+    def wake_now(self):
+        """Wake up the waiting task (from the event loop thread)."""
+        self.woken = True
+        if self.future:
+            _set_done(self.future)
+
+    def wake(self):
+        """Wake up the waiting task."""
+        try:
+            self.loop.call_soon_threadsafe(self.wake_now)
+        except RuntimeError:
+            # loop already closed
+            pass
+
+class AsyncCompPlayer(CompPlayer):
+    """Backing track player running as an asyncio task.
+
+    Has the CompPlayer interface, so it can be used from other threads
+    the same way. Coroutine versions of the control methods
+    (start_async() etc.) are available for code running in the player
+    event loop.
+
+    The player runs in 'loop' when given, otherwise in a new event loop
+    in its own thread. 'wait_strategy' is ignored, the player always
+    uses the AsyncioWait timer.
+    """
+    # pylint: disable=too-many-arguments
+    def __init__(self, calibration=None, wait_strategy=None, stats_file=None,
+                 backend=None, realtime=False, loop=None):
+        self.loop = loop
+        self.own_loop = loop is None
+        if self.own_loop:
+            self.loop = asyncio.new_event_loop()
+        try:
+            super().__init__(calibration, wait_strategy, stats_file, backend,
+                             realtime)
+        except Exception:
+            if self.own_loop:
+                self.loop.close()
+            raise
+
+    def _create_waiter(self, wait_strategy):
+        return AsyncioWait(self.loop)
+
+    def _calibrated(self, _calibration):
+        # AsyncioWait does not depend on the calibration
+        pass
+
+    def _start_thread(self):
+        if not self.own_loop:
+            self.loop.call_soon_threadsafe(self.loop.create_task,
+                                           self.run_async())
+            return
+        self.thread = threading.Thread(name="comp player",
+                                       daemon=True,
+                                       target=self.run)
+        self.thread.start()
+
+    def run(self):
+        """Run the player event loop (in the player thread)."""
+        if self.realtime:
+            self._setup_realtime()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.run_async())
+        finally:
+            self.loop.close()
+            self.thread = None
+
+    async def run_async(self):
+        """The main loop of the player."""
+        while not self.quit:
+            deadline = self._dispatch()
+            if deadline is None:
+                deadline = time.perf_counter() + IDLE_TIMEOUT
+            await self.waiter.wait_until(deadline)
+
+    def _apply(self, func, *args):
+        """Run a command now (in the event loop thread), wake the player."""
+        func(*args)
+        self.waiter.wake_now()
+
+    async def start_async(self, exercise, start_time, main_track, tempo):
+        """Start playing an exercise, return the session number."""
+        with self.idle_lock:
+            self.session += 1
+            session = self.session
+            self.idle.clear()
+        self._apply(self._start, session, exercise, start_time,
+                    _precise_time(start_time), main_track, tempo)
+        return session
+
+    async def stop_async(self):
+        """Stop playing current exercise track."""
+        self._apply(self._stop)
+
+    async def change_tempo_async(self, tempo, start_time=None):
+        """Change current tempo and position."""
+        if start_time:
+            anchor_time = _precise_time(start_time)
+        else:
+            anchor_time = None
+        self._apply(self._change_tempo, tempo, start_time, anchor_time,
+                    time.perf_counter())
+
+    async def change_tempo_map_async(self, tempo_map):
+        """Replace the tempo map of current playback."""
+        self._apply(self._change_tempo_map, tempo_map)
+
+    async def change_track_async(self, track_name):
+        """Change current backing track."""
+        self._apply(self._change_track, track_name)
+
+    async def set_loop_async(self, loop):
+        """Turn the loop mode on or off."""
+        self._apply(self._set_loop, loop)
+
+    async def queue_exercise_async(self, exercise):
+        """Add an exercise to the playlist."""
+        self._apply(self._queue_exercise, exercise)
+
+    async def wait_idle_async(self):
+        """Wait until the player finishes playing."""
+        while not self.idle.is_set():
+            await asyncio.sleep(IDLE_TIMEOUT)
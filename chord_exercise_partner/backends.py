@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""MIDI output backends.
+
+A backend lists the available output ports and opens them. An opened
+port provides send_message(message) and close_port() methods, as the
+python-rtmidi MidiOut objects do.
+
+A backend with the 'bursts' attribute set accepts many messages, using
+running status, in a single send_message() call.
+
+MIDI input ports are listed and opened the same way (get_input_ports(),
+open_input_port(), open_virtual_input_port()). An opened input port
+provides set_callback(func, data=None), cancel_callback() and
+close_port(), as the python-rtmidi MidiIn objects do: func((message,
+delta_time), data) is called, in a backend thread, for every message
+received.
+"""
+
+import time
+
+class BackendError(Exception):
+    """Raised when a MIDI backend operation fails."""
+    pass
+
+class RtMidiBackend:
+    """MIDI output via the python-rtmidi library."""
+    name = "rtmidi"
+    bursts = False # the rtmidi APIs take one complete message at a time
+
+    def __init__(self):
+        try:
+            import rtmidi
+        except ImportError as err:
+            raise BackendError("rtmidi module not available: {}".format(err))
+        self.rtmidi = rtmidi
+
+    def get_ports(self):
+        """Return list of the available port names."""
+        try:
+            return self.rtmidi.MidiOut().get_ports()
+        except self.rtmidi.RtMidiError as err:
+            raise BackendError(str(err))
+
+    def open_port(self, number):
+        """Open port of given number (index in the get_ports() list)."""
+        try:
+            return self.rtmidi.MidiOut().open_port(number)
+        except self.rtmidi.RtMidiError as err:
+            raise BackendError(str(err))
+
+    def open_virtual_port(self, name):
+        """Create and open a virtual port."""
+        try:
+            return self.rtmidi.MidiOut().open_virtual_port(name)
+        except self.rtmidi.RtMidiError as err:
+            raise BackendError(str(err))
+
+    def get_input_ports(self):
+        """Return list of the available input port names."""
+        try:
+            return self.rtmidi.MidiIn().get_ports()
+        except self.rtmidi.RtMidiError as err:
+            raise BackendError(str(err))
+
+    def open_input_port(self, number):
+        """Open input port of given number (index in get_input_ports())."""
+        try:
+            return self.rtmidi.MidiIn().open_port(number)
+        except self.rtmidi.RtMidiError as err:
+            raise BackendError(str(err))
+
+    def open_virtual_input_port(self, name):
+        """Create and open a virtual input port."""
+        try:
+            return self.rtmidi.MidiIn().open_virtual_port(name)
+        except self.rtmidi.RtMidiError as err:
+            raise BackendError(str(err))
+
+class RecordingPort:
+    """Fake MIDI port recording messages sent, with perf_counter() times.
+
+    A burst of messages is recorded as sent: as a single bytes object.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.messages = []
+        self.closed = False
+
+    def send_message(self, message):
+        """Record a message."""
+        self.messages.append((time.perf_counter(), message))
+
+    def close_port(self):
+        """Mark the port closed."""
+        self.closed = True
+
+class FakeInputPort:
+    """Fake MIDI input port, messages are fed with play()."""
+    def __init__(self, name):
+        self.name = name
+        self.callback = None
+        self.data = None
+        self.closed = False
+
+    def set_callback(self, func, data=None):
+        """Set function to be called for every message received."""
+        self.callback = func
+        self.data = data
+
+    def cancel_callback(self):
+        """Remove the callback."""
+        self.callback = None
+
+    def play(self, message, delta_time=0.0):
+        """Deliver a message to the callback (in the calling thread)."""
+        if self.callback and not self.closed:
+            self.callback((list(message), delta_time), self.data)
+
+    def close_port(self):
+        """Mark the port closed."""
+        self.closed = True
+
+class FakeBackend:
+    """In-process backend with recording ports, for tests and benchmarks."""
+    name = "fake"
+
+    def __init__(self, port_names=("Fake MIDI port",), bursts=False,
+                 input_port_names=("Fake MIDI input",)):
+        self.port_names = list(port_names)
+        self.bursts = bursts
+        self.input_port_names = list(input_port_names)
+        self.opened = []
+
+    def get_ports(self):
+        """Return list of the available port names."""
+        return list(self.port_names)
+
+    def open_port(self, number):
+        """Open port of given number (index in the get_ports() list)."""
+        try:
+            port = RecordingPort(self.port_names[number])
+        except IndexError:
+            raise BackendError("No such port: {}".format(number))
+        self.opened.append(port)
+        return port
+
+    def open_virtual_port(self, name):
+        """Create and open a virtual port."""
+        port = RecordingPort(name)
+        self.opened.append(port)
+        return port
+
+    def get_input_ports(self):
+        """Return list of the available input port names."""
+        return list(self.input_port_names)
+
+    def open_input_port(self, number):
+        """Open input port of given number (index in get_input_ports())."""
+        try:
+            port = FakeInputPort(self.input_port_names[number])
+        except IndexError:
+            raise BackendError("No such input port: {}".format(number))
+        self.opened.append(port)
+        return port
+
+    def open_virtual_input_port(self, name):
+        """Create and open a virtual input port."""
+        port = FakeInputPort(name)
+        self.opened.append(port)
+        return port
+
+BACKENDS = {
+    RtMidiBackend.name: RtMidiBackend,
+    FakeBackend.name: FakeBackend,
+    }
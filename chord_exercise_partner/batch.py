@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+"""Batch exercise generation.
+
+Generates many exercises in parallel worker processes, writing them
+as JSON lines or as MIDI files with backing tracks. Every exercise gets
+its own random generator seeded from the base seed and the exercise
+number, so the output does not depend on the number of workers.
+
+Usage: python -m chord_exercise_partner.batch --help
+"""
+
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from .exercise import DEFAULT_LENGTH, ROMAN, Exercise
+from .notes import HARMONIZATION, SCALES, normalize_scale_root
+from .progressions import PROGRESSIONS
+from .smf import write_midi_file
+from .tracks import DEFAULT_TRACK, MAIN_TRACKS
+
+RANDOM = "random"
+
+CHUNK_SIZE = 64       # exercises per worker task
+TASKS_PER_WORKER = 4  # tasks queued per worker
+
+Settings = collections.namedtuple("Settings",
+                                  "modes roots harmonizations progressions"
+                                  " length seed output_format output_dir"
+                                  " track tempo")
+
+def exercise_seed(base_seed, index):
+    """Return seed of the exercise number 'index'."""
+    return base_seed * 1000003 + index
+
+def make_exercise(settings, index):
+    """Create exercise number 'index' of a batch."""
+    seed = exercise_seed(settings.seed, index)
+    rng = random.Random(seed)
+    mode = rng.choice(settings.modes)
+    root = rng.choice(settings.roots)
+    if root == RANDOM:
+        root = None
+    else:
+        # the same note, spelled as the scale of this mode is named
+        root = normalize_scale_root(root, mode)
+    harmonization = rng.choice(settings.harmonizations)
+    progression = rng.choice(settings.progressions)
+    if progression == RANDOM:
+        progression = None
+    exercise = Exercise(length=settings.length,
+                        root=root,
+                        mode=mode,
+                        harmonization=harmonization,
+                        progression=progression,
+                        rng=rng)
+    return seed, progression, exercise
+
+def generate_chunk(settings, start, count):
+    """Generate exercises [start, start + count) of a batch.
+
+    Return list of JSON-encoded exercise descriptions. In the "midi"
+    format the exercise MIDI files are written too.
+    """
+    result = []
+    for index in range(start, start + count):
+        seed, progression, exercise = make_exercise(settings, index)
+        record = collections.OrderedDict([
+            ("index", index),
+            ("seed", seed),
+            ("scale", exercise.scale_name),
+            ("root", exercise.root),
+            ("mode", exercise.mode),
+            ("harmonization", exercise.harmonization),
+            ("progression", progression or RANDOM),
+            ("degrees", [ROMAN[degree] for degree in exercise.progression]),
+            ("chords", list(exercise.chord_names)),
+            ])
+        if settings.output_format == "midi":
+            filename = "exercise-{:06}.mid".format(index)
+            write_midi_file(os.path.join(settings.output_dir, filename),
+                            exercise, settings.track, settings.tempo)
+            record["file"] = filename
+        result.append(json.dumps(record, ensure_ascii=False))
+    return result
+
+def run_batch(settings, count, jobs, output):
+    """Generate 'count' exercises with 'jobs' processes.
+
+    The results are written to the 'output' stream in order, as soon as
+    they are available. Only a few tasks per worker are queued at a time,
+    so memory use does not depend on 'count'.
+    """
+    pending = collections.deque()
+    next_start = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        while next_start < count or pending:
+            while next_start < count and len(pending) < jobs * TASKS_PER_WORKER:
+                chunk = min(CHUNK_SIZE, count - next_start)
+                pending.append(executor.submit(generate_chunk, settings,
+                                               next_start, chunk))
+                next_start += chunk
+            for line in pending.popleft().result():
+                output.write(line + "\n")
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+    all_roots = sorted(set(root for roots in SCALES.values() for root in roots))
+    parser = argparse.ArgumentParser(
+        description="Generate chord exercises in bulk.",
+        epilog="Options that may be repeated choose randomly from the values given.")
+    parser.add_argument("--count", "-n", type=int, default=100,
+                        help="number of exercises (default: %(default)s)")
+    parser.add_argument("--mode", action="append", choices=list(SCALES),
+                        help="scale mode (default: major)")
+    parser.add_argument("--root", action="append",
+                        choices=[RANDOM] + all_roots,
+                        help="scale root (default: random)")
+    parser.add_argument("--harmonization", action="append",
+                        choices=list(HARMONIZATION),
+                        help="harmonization (default: triads)")
+    parser.add_argument("--progression", action="append",
+                        choices=[RANDOM] + list(PROGRESSIONS),
+                        help="chord progression (default: random)")
+    parser.add_argument("--length", type=int, default=DEFAULT_LENGTH,
+                        help="exercise length in bars (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="base random seed (default: random)")
+    parser.add_argument("--jobs", "-j", type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: %(default)s)")
+    parser.add_argument("--format", choices=["jsonl", "midi"], default="jsonl",
+                        help="output format (default: %(default)s)")
+    parser.add_argument("--output", "-o", metavar="PATH",
+                        help="output file (jsonl, default: stdout) or"
+                             " directory (midi)")
+    parser.add_argument("--track", choices=list(MAIN_TRACKS),
+                        default=DEFAULT_TRACK,
+                        help="backing track for MIDI output (default: %(default)s)")
+    parser.add_argument("--tempo", type=int, default=60,
+                        help="tempo for MIDI output (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if args.format == "midi" and not args.output:
+        parser.error("--output directory is required for MIDI output")
+    if args.count < 1 or args.jobs < 1 or args.length < 1:
+        parser.error("--count, --jobs and --length must be positive")
+    return args
+
+def main(argv=None):
+    """Main entry point."""
+    args = parse_args(argv)
+    if args.seed is None:
+        args.seed = random.SystemRandom().randrange(2 ** 32)
+        print("Base seed:", args.seed, file=sys.stderr)
+    output_dir = None
+    if args.format == "midi":
+        output_dir = args.output
+        os.makedirs(output_dir, exist_ok=True)
+    settings = Settings(modes=args.mode or ["major"],
+                        roots=args.root or [RANDOM],
+                        harmonizations=args.harmonization or ["triads"],
+                        progressions=args.progression or [RANDOM],
+                        length=args.length,
+                        seed=args.seed,
+                        output_format=args.format,
+                        output_dir=output_dir,
+                        track=args.track,
+                        tempo=args.tempo)
+    if args.format == "midi":
+        index_path = os.path.join(output_dir, "index.jsonl")
+        with open(index_path, "wt", encoding="utf-8") as output:
+            run_batch(settings, args.count, args.jobs, output)
+    elif args.output:
+        with open(args.output, "wt", encoding="utf-8") as output:
+            run_batch(settings, args.count, args.jobs, output)
+    else:
+        run_batch(settings, args.count, args.jobs, sys.stdout)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+"""Timed MIDI event queue."""
+
+from array import array
+
+class EventQueue:
+    """Time-ordered queue of MIDI messages.
+
+    Event times are kept in an array parallel to the list of messages
+    and a read cursor is moved forward as events are taken, so taking
+    an event costs O(1) and copies nothing.
+    """
+    __slots__ = ("times", "messages", "cursor")
+
+    def __init__(self):
+        self.times = array("d")
+        self.messages = []
+        self.cursor = 0
+
+    def __len__(self):
+        return len(self.messages) - self.cursor
+
+    def clear(self):
+        """Remove all events."""
+        del self.times[:]
+        del self.messages[:]
+        self.cursor = 0
+
+    def extend(self, events):
+        """Append sorted (time, message) events.
+
+        The events must not be earlier than the ones already queued.
+        """
+        if self.cursor:
+            # drop already consumed events
+            del self.times[:self.cursor]
+            del self.messages[:self.cursor]
+            self.cursor = 0
+        for ev_time, message in events:
+            self.times.append(ev_time)
+            self.messages.append(message)
+
+    def fill(self, stream):
+        """Take events from a stream of event lists until non-empty.
+
+        Return False when the queue is empty and the stream exhausted.
+        """
+        while not len(self):
+            chunk = next(stream, None)
+            if chunk is None:
+                return False
+            self.extend(chunk)
+        return True
+
+    def next_time(self):
+        """Return time of the first event in the queue."""
+        return self.times[self.cursor]
+
+    def pop(self):
+        """Remove the first event from the queue and return its message."""
+        message = self.messages[self.cursor]
+        self.cursor += 1
+        return message
@@ -3,23 +3,104 @@
 """C.E.P. exercise generator."""
 
 import random
+from array import array
 
-from .notes import (SCALES, chord_name, chord_notes, normalize_scale_root,
-                    note_name)
-from .progressions import get_progression
+from .notes import CHORDS, SCALES, normalize_scale_root, note_name, note_number
+from .progressions import PROGRESSIONS, get_progression
 
 LEAD_IN = 2 # bars
 DEFAULT_LENGTH = 10 # bars
 
 ROMAN = ["I", "II", "III", "IV", "V", "VI", "VII"]
 
+_MASK64 = 0xffffffffffffffff
+
+def bar_degree(seed, bar):
+    """Return random scale degree of a bar, derived from seed and bar only."""
+    # splitmix64 finalizer
+    value = (seed * 0x9e3779b97f4a7c15 + (bar + 1) * 0xbf58476d1ce4e5b9) & _MASK64
+    value ^= value >> 31
+    value = (value * 0x94d049bb133111eb) & _MASK64
+    value ^= value >> 29
+    return value % 7
+
+class EndlessProgression:
+    """Chord progression of an endless exercise.
+
+    Degrees are computed on demand – either repeating a named
+    progression, or random, drawn from the seed – so any bar can be
+    accessed directly and nothing is stored per bar. It has no length
+    and cannot be iterated over, as that would never end.
+    """
+    __slots__ = ("seed", "pattern")
+
+    def __init__(self, seed, pattern=None):
+        self.seed = seed
+        self.pattern = pattern
+
+    def __len__(self):
+        raise TypeError("Endless progression has no length")
+
+    def __iter__(self):
+        raise TypeError("Endless progression cannot be iterated over,"
+                        " index it by bar number")
+
+    def __getitem__(self, bar):
+        if bar < 0:
+            raise IndexError("Negative bar number")
+        if self.pattern:
+            return self.pattern[bar % len(self.pattern)]
+        return bar_degree(self.seed, bar)
+
+class ChordNames:
+    """Sequence of chord names of an exercise, computed on access.
+
+    For an endless exercise it has no length and cannot be iterated
+    over, as the EndlessProgression.
+    """
+    __slots__ = ("exercise",)
+
+    def __init__(self, exercise):
+        self.exercise = exercise
+
+    def __len__(self):
+        if self.exercise.length is None:
+            raise TypeError("Endless exercise has no length")
+        return self.exercise.length
+
+    def __iter__(self):
+        if self.exercise.length is None:
+            raise TypeError("Endless exercise chord names cannot be iterated"
+                            " over, index them by bar number")
+        return (self.exercise.chord_name(bar)
+                for bar in range(self.exercise.length))
+
+    def __getitem__(self, bar):
+        if isinstance(bar, slice):
+            return [self[i] for i in range(*bar.indices(len(self)))]
+        return self.exercise.chord_name(bar)
+
 class Exercise:
-    """An exercise – a scale and chord progression to play."""
-    # pylint: disable=too-few-public-methods
+    """An exercise – a scale and chord progression to play.
+
+    Random choices are made with 'rng' (a random.Random instance),
+    the global random number generator by default.
+
+    'length' of None makes an endless exercise: the progression is then
+    computed bar by bar, on demand, so memory use does not grow with
+    the session length.
+    """
+    # pylint: disable=too-few-public-methods,too-many-arguments
+    # pylint: disable=too-many-instance-attributes
+    __slots__ = ("length", "mode", "harmonization", "root", "scale_name",
+                 "beats_in_bar", "beat_duration", "bar_duration",
+                 "whole_note_duration", "progression", "chords")
+
     def __init__(self, length=DEFAULT_LENGTH,
                  root=None, mode="major", harmonization="triads",
-                 progression=None):
-        random.seed()
+                 progression=None, rng=None):
+        if rng is None:
+            rng = random
 
         self.length = length
 
@@ -34,7 +115,7 @@ class Exercise:
             else:
                 raise TypeError("Root must be int or str")
         else:
-            root = random.choice(SCALES[mode])
+            root = rng.choice(SCALES[mode])
 
         root = normalize_scale_root(root, mode)
         self.root = root
@@ -46,22 +127,34 @@ class Exercise:
         self.bar_duration = self.beat_duration * self.beats_in_bar
         self.whole_note_duration = 60.0 * 4.0
 
-        print("The scale is:", self.scale_name)
-
-        if progression:
-            self.progression = get_progression(progression, length)
+        if length is None:
+            if progression:
+                self.progression = EndlessProgression(
+                    None, array("B", PROGRESSIONS[progression]))
+            else:
+                self.progression = EndlessProgression(rng.getrandbits(64))
+        elif progression:
+            self.progression = array("B", get_progression(progression, length))
         else:
-            self.progression = [random.randint(0, 6) for i in range(length)]
+            self.progression = array("B", (rng.randint(0, 6) for i in range(length)))
+
+        # notes.Chord for each scale degree
+        self.chords = CHORDS[harmonization, mode][note_number(root)]
+
+    @property
+    def endless(self):
+        """True for an endless exercise."""
+        return self.length is None
+
+    @property
+    def chord_names(self):
+        """Chord names of all the exercise bars (a sequence)."""
+        return ChordNames(self)
 
-        roman_numbers = [ROMAN[x] for x in self.progression]
-        print("The progression is: {}".format(",".join(roman_numbers)))
-        self.chord_names = [chord_name(root, x, mode, harmonization)
-                            for x in self.progression]
-        #print("Which is: {}".format(",".join(self.chord_names)))
+    def chord_name(self, bar):
+        """Return chord name at given bar."""
+        return self.chords[self.progression[bar]].name
 
     def chord_notes(self, bar):
         """Return chord notes (relative to C note) at given bar."""
-        return chord_notes(self.root,
-                           self.progression[bar],
-                           self.mode,
-                           self.harmonization)
+        return self.chords[self.progression[bar]].notes
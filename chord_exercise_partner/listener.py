@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+"""Chord recognition on MIDI input."""
+
+import threading
+import time
+from collections import deque, namedtuple
+
+from .backends import BackendError
+from .notes import recognize_chord
+
+VIRT_INPUT_NAME = "Chord Exercise Partner Input"
+
+# how often the idle listener checks for quit
+IDLE_TIMEOUT = 0.1 # seconds
+
+CC_SUSTAIN = 64
+CC_ALL_NOTES_OFF = 123
+
+class ChordMatch(namedtuple("ChordMatch",
+                            "time pc_set chord expected match delay")):
+    """Chord recognized on the MIDI input.
+
+    'time' is the time.perf_counter() time the last note-on was received,
+    'pc_set' the pitch class set sounding then and 'chord' its name (that
+    of the expected chord when matched, None when not a known chord). 'expected' is the notes.Chord to be played at
+    that time (or None) and 'match' tells if it was played. 'delay' is the
+    time from receiving the note-on to the recognition (in seconds).
+    """
+    __slots__ = ()
+
+class ChordListener:
+    """Recognizes chords played on a MIDI input port.
+
+    The port callback only queues the messages received, with their
+    time.perf_counter() times. The listener thread keeps the set of the
+    pitch classes sounding (keys held or sustained by the pedal), updated
+    in constant time for every message, and after each note-on looks the
+    chord up in the notes.CHORD_LOOKUP table.
+
+    'expected(when)' returns the notes.Chord to be played at
+    perf_counter() time 'when', or None. Every ChordMatch is passed to
+    'on_match' (called in the listener thread) and published in the
+    'last_match' attribute, which may be read from any thread.
+
+    A matching chord is named as the expected one, others are spelled
+    with flats or sharps as the 'use_flats' attribute says (to be set
+    for the key of the exercise, see notes.scale_uses_flats()).
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, port, expected=None, on_match=None):
+        self.port = port
+        self.expected = expected
+        self.on_match = on_match
+        self.last_match = None
+        self.use_flats = None
+        self.quit = False
+        self.messages = deque()
+        self.wakeup = threading.Event()
+        self.sounding = bytearray(128)
+        self.sustained = set()
+        self.pedal = False
+        self.counts = [0] * 12 # notes sounding per pitch class
+        self.pc_set = 0
+        self.thread = threading.Thread(name="chord listener",
+                                       daemon=True,
+                                       target=self.run)
+        self.thread.start()
+        port.set_callback(self._received)
+
+    def _received(self, event, _data=None):
+        """Queue a message received (called in the backend thread)."""
+        self.messages.append((time.perf_counter(), event[0]))
+        self.wakeup.set()
+
+    def close(self):
+        """Stop listening and close the port."""
+        self.port.cancel_callback()
+        self.quit = True
+        self.wakeup.set()
+        self.port.close_port()
+
+    def _set_sounding(self, note, sounding):
+        """Update the pitch class set when a note starts or stops sounding."""
+        if self.sounding[note] == sounding:
+            return
+        self.sounding[note] = sounding
+        pitch_class = note % 12
+        if sounding:
+            self.counts[pitch_class] += 1
+            self.pc_set |= 1 << pitch_class
+        else:
+            self.counts[pitch_class] -= 1
+            if not self.counts[pitch_class]:
+                self.pc_set &= ~(1 << pitch_class)
+
+    def _handle(self, message):
+        """Apply a message to the note state.
+
+        Return True for a note-on.
+        """
+        if len(message) < 3:
+            return False
+        kind = message[0] & 0xf0
+        if kind == 0x90 and message[2]:
+            note = message[1]
+            self.sustained.discard(note)
+            self._set_sounding(note, True)
+            return True
+        if kind == 0x80 or kind == 0x90:
+            note = message[1]
+            if self.pedal:
+                self.sustained.add(note)
+            else:
+                self._set_sounding(note, False)
+        elif kind == 0xb0 and message[1] == CC_SUSTAIN:
+            self.pedal = message[2] >= 64
+            if not self.pedal:
+                for note in self.sustained:
+                    self._set_sounding(note, False)
+                self.sustained.clear()
+        elif kind == 0xb0 and message[1] == CC_ALL_NOTES_OFF:
+            for note in range(128):
+                self._set_sounding(note, False)
+            self.sustained.clear()
+        return False
+
+    def _report(self, received):
+        """Recognize the chord sounding, report it."""
+        pc_set = self.pc_set
+        expected = self.expected(received) if self.expected else None
+        match = expected is not None and pc_set in expected.pc_sets
+        if match:
+            name = expected.name
+        else:
+            name = recognize_chord(pc_set, self.use_flats)
+        result = ChordMatch(received, pc_set, name,
+                            expected, match, time.perf_counter() - received)
+        self.last_match = result
+        if self.on_match:
+            self.on_match(result)
+
+    def run(self):
+        """The listener thread loop."""
+        messages = self.messages
+        try:
+            while not self.quit:
+                self.wakeup.wait(IDLE_TIMEOUT)
+                self.wakeup.clear()
+                last_note_on = None
+                while messages:
+                    received, message = messages.popleft()
+                    if self._handle(message):
+                        last_note_on = received
+                if last_note_on is not None:
+                    self._report(last_note_on)
+        finally:
+            self.thread = None
+
+def open_listener(backend, port=None, expected=None, on_match=None):
+    """Open a MIDI input port and start a ChordListener on it.
+
+    'port' is a port number or name, when None a new virtual port is
+    created. Raise BackendError when the port cannot be opened.
+    """
+    if port is None:
+        midi_port = backend.open_virtual_input_port(VIRT_INPUT_NAME)
+    else:
+        ports = backend.get_input_ports()
+        if isinstance(port, int):
+            number = port
+        elif port in ports:
+            number = ports.index(port)
+        else:
+            raise BackendError("Unknown MIDI input port: {}".format(port))
+        midi_port = backend.open_input_port(number)
+    return ChordListener(midi_port, expected, on_match)
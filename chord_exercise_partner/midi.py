@@ -1,23 +1,94 @@
 # -*- coding: utf-8 -*-
 
-"""Midi messages."""
+"""Midi messages.
+
+Messages are immutable tuples of bytes values. The same message is always
+the same object, so no memory is allocated for messages when building
+or sending events.
+"""
+
+from array import array
+from itertools import chain
+
+MIDDLE_C = 60
+
+# 'note off' messages with zero velocity: NOTE_OFF[channel - 1][note]
+NOTE_OFF = tuple(tuple((0x80 + channel, note, 0) for note in range(128))
+                 for channel in range(16))
+
+# 'all sound off' messages: ALL_SOUND_OFF[channel - 1]
+ALL_SOUND_OFF = tuple((0xb0 + channel, 0x78, 0) for channel in range(16))
+
+_MESSAGES = {}
+
+def intern_message(message):
+    """Return the shared instance of a message (a tuple of ints)."""
+    message = tuple(message)
+    return _MESSAGES.setdefault(message, message)
 
 def note_on(channel, note, velocity):
     """Create a 'note on' midi message.
 
     Channel should be 1-16, note: 0-127 and velocity 0.0-1.0."""
-    return [0x90 + (channel - 1) % 16, note % 128, int(velocity * 127) % 128]
+    return intern_message((0x90 + (channel - 1) % 16, note % 128, int(velocity * 127) % 128))
 
 def note_off(channel, note, velocity=0.0):
     """Create a 'note off' midi message.
 
     Channel should be 1-16, note: 0-127 and velocity 0.0-1.0."""
-    return [0x80 + (channel - 1) % 16, note % 128, int(velocity * 127) % 128]
+    if not velocity:
+        return NOTE_OFF[(channel - 1) % 16][note % 128]
+    return intern_message((0x80 + (channel - 1) % 16, note % 128, int(velocity * 127) % 128))
 
 def program_change(channel, program):
     """Create a 'program change' midi message.
 
     Channel should be:  1-16, program: 1-128."""
-    return [0xc0 + (channel - 1) % 16, (program - 1) % 128]
+    return intern_message((0xc0 + (channel - 1) % 16, (program - 1) % 128))
 
-MIDDLE_C = 60
+def encode_messages(messages):
+    """Encode a sequence of messages into one contiguous bytes buffer."""
+    return bytes(chain.from_iterable(messages))
+
+def encode_running_status(messages):
+    """Encode a sequence of messages into one buffer, with running status.
+
+    A channel message status byte is left out when it is the same as
+    the previous one. Zero velocity note-offs are encoded as zero
+    velocity note-ons, so they share the status with the note-ons.
+    """
+    data = bytearray()
+    running = None
+    for message in messages:
+        status = message[0]
+        if status >= 0xf0:
+            # system messages cancel running status
+            data.extend(message)
+            running = None
+            continue
+        if status & 0xf0 == 0x80 and not message[2]:
+            status += 0x10
+        if status != running:
+            data.append(status)
+            running = status
+        data.extend(message[1:])
+    return bytes(data)
+
+def encode_events(events):
+    """Encode a sequence of (time, message) events.
+
+    Return (times, data, offsets) where 'times' is an array of the event
+    times, 'data' the messages packed into a single bytes object and
+    'offsets' an array of message boundaries: message i is
+    data[offsets[i]:offsets[i + 1]].
+    """
+    times = array("d")
+    offsets = array("L", [0])
+    messages = []
+    offset = 0
+    for ev_time, message in events:
+        times.append(ev_time)
+        messages.append(message)
+        offset += len(message)
+        offsets.append(offset)
+    return times, encode_messages(messages), offsets
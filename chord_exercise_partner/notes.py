@@ -2,8 +2,14 @@
 
 """
 Basic music theory – note names, scale harmonisation.
+
+Scales and chords are also represented as pitch class sets: 12-bit
+integers with bit n set when pitch class n (0 = C) is present. All the
+chords of every harmonization are computed once, at import time.
 """
 
+from collections import namedtuple
+
 # pylint: disable=bad-whitespace,
 
          # 0    1     2    3    4     5    6     7    8    9    10    11
@@ -18,6 +24,9 @@ NOTE_NUMBERS = {name: i for i, name in list(enumerate(S_NOTES)) + list(enumerate
 SCALES = {
     "major": ["C", "G", "D", "A", "E", "B", "F♯", "D♭", "A♭", "E♭", "B♭", "F"],
     "minor": ["A", "E", "B", "F♯", "C♯", "G♯", "D♯", "B♭", "F", "C", "G", "D"],
+    "dorian": ["D", "A", "E", "B", "F♯", "C♯", "G♯", "E♭", "B♭", "F", "C", "G"],
+    "mixolydian": ["G", "D", "A", "E", "B", "F♯", "C♯", "A♭", "E♭", "B♭", "F", "C"],
+    "harmonic minor": ["A", "E", "B", "F♯", "C♯", "G♯", "D♯", "B♭", "F", "C", "G", "D"],
 }
 
 HARMONIZATION = {
@@ -40,6 +49,33 @@ HARMONIZATION = {
             (8, ""),         # major chord on minor sixth
             (10, ("", "7")), # major or seventh chord on minor seventh
             ],
+        "dorian": [
+            (0, "m"),    # minor chord on root
+            (2, "m"),    # minor chord on major second
+            (3, ""),     # major chord on minor third
+            (5, ""),     # major chord on perfect fourth
+            (7, "m"),    # minor chord on perfect fifth
+            (9, "dim"),  # diminished chord on major sixth
+            (10, ""),    # major chord on minor seventh
+            ],
+        "mixolydian": [
+            (0, ""),     # major chord on root
+            (2, "m"),    # minor chord on major second
+            (4, "dim"),  # diminished chord on major third
+            (5, ""),     # major chord on perfect fourth
+            (7, "m"),    # minor chord on perfect fifth
+            (9, "m"),    # minor chord on major sixth
+            (10, ""),    # major chord on minor seventh
+            ],
+        "harmonic minor": [
+            (0, "m"),    # minor chord on root
+            (2, "dim"),  # diminished chord on major second
+            (3, "aug"),  # augmented chord on minor third
+            (5, "m"),    # minor chord on perfect fourth
+            (7, ""),     # major chord on perfect fifth
+            (8, ""),     # major chord on minor sixth
+            (11, "dim"), # diminished chord on major seventh
+            ],
     },
     "7ths": {
         "major": [
@@ -60,6 +96,33 @@ HARMONIZATION = {
             (8, "maj7"),  # major chord on minor sixth
             (10, "7"),    # major or seventh chord on minor seventh
             ],
+        "dorian": [
+            (0, "m7"),    # minor 7th chord on root
+            (2, "m7"),    # minor 7th chord on major second
+            (3, "maj7"),  # major 7th chord on minor third
+            (5, "7"),     # 7th chord on perfect fourth
+            (7, "m7"),    # minor 7th chord on perfect fifth
+            (9, "m7♭5"),  # half-diminished chord on major sixth
+            (10, "maj7"), # major 7th chord on minor seventh
+            ],
+        "mixolydian": [
+            (0, "7"),     # 7th chord on root
+            (2, "m7"),    # minor 7th chord on major second
+            (4, "m7♭5"),  # half-diminished chord on major third
+            (5, "maj7"),  # major 7th chord on perfect fourth
+            (7, "m7"),    # minor 7th chord on perfect fifth
+            (9, "m7"),    # minor 7th chord on major sixth
+            (10, "maj7"), # major 7th chord on minor seventh
+            ],
+        "harmonic minor": [
+            (0, "mMaj7"),   # minor-major 7th chord on root
+            (2, "m7♭5"),    # half-diminished chord on major second
+            (3, "maj7♯5"),  # augmented major 7th chord on minor third
+            (5, "m7"),      # minor 7th chord on perfect fourth
+            (7, "7"),       # 7th chord on perfect fifth
+            (8, "maj7"),    # major 7th chord on minor sixth
+            (11, "dim7"),   # diminished 7th chord on major seventh
+            ],
     },
     }
 
@@ -67,10 +130,14 @@ CHORD_NOTES = {
     "": (0, 4, 7),
     "m": (0, 3, 7),
     "dim": (0, 3, 6),
+    "aug": (0, 4, 8),
     "7": (0, 4, 7, 10),
     "maj7": (0, 4, 7, 11),
     "m7": (0, 3, 7, 10),
     "m7♭5": (0, 3, 6, 10),
+    "dim7": (0, 3, 6, 9),
+    "mMaj7": (0, 3, 7, 11),
+    "maj7♯5": (0, 4, 8, 11),
     }
 
 def note_name(note):
@@ -93,38 +160,102 @@ def normalize_scale_root(note, mode):
         return name
     return S_NOTES[note]
 
-def chord_name(root, degree, mode, harmonisation="triads"):
-    """Return name of a chord build on given degree of a root-mode scale."""
-    if isinstance(root, int):
-        root_note = root
-        root = normalize_scale_root(root, mode)
-    else:
-        root_note = NOTE_NUMBERS[root]
-
+def scale_uses_flats(root, mode):
+    """Check if notes of a scale are spelled with flats (or sharps)."""
+    root = normalize_scale_root(root, mode)
     # from circle of fifths
-    use_flats = SCALES[mode].index(root) > 5
+    return SCALES[mode].index(root) > 5
 
-    note, quality = HARMONIZATION[harmonisation][mode][degree]
+def pitch_class_set(notes):
+    """Return pitch class set of the notes."""
+    pc_set = 0
+    for note in notes:
+        pc_set |= 1 << (note % 12)
+    return pc_set
 
-    chord_root = (root_note + note) % 12
-    name = NOTES[use_flats][chord_root]
+def transpose_set(pc_set, interval):
+    """Transpose a pitch class set by an interval (in semitones)."""
+    interval %= 12
+    return ((pc_set << interval) | (pc_set >> (12 - interval))) & 0xfff
 
-    if not isinstance(quality, str):
-        return " or ".join((name + q) for q in quality)
-    return name + quality
+CHORD_SETS = {quality: pitch_class_set(notes)
+              for quality, notes in CHORD_NOTES.items()}
 
-def chord_notes(root, degree, mode, harmonisation="triads"):
-    """Return name of a chord build on given degree of a root-mode scale."""
-    if isinstance(root, int):
-        root_note = root
-    else:
-        root_note = NOTE_NUMBERS[root]
+# pitch class sets of the scales built on C
+SCALE_SETS = {mode: pitch_class_set(note for note, _ in degrees)
+              for mode, degrees in HARMONIZATION["triads"].items()}
+
+def _chord_lookup():
+    """Build the CHORD_LOOKUP table."""
+    table = [None] * 4096
+    for quality, pc_set in CHORD_SETS.items():
+        for root in range(12):
+            key = transpose_set(pc_set, root)
+            # symmetric chords (aug, dim7) are named after the lowest root
+            if table[key] is None:
+                table[key] = (root, quality)
+    return tuple(table)
+
+# CHORD_LOOKUP[pc_set]: (root, quality) of the chord of exactly these
+# pitch classes, or None
+CHORD_LOOKUP = _chord_lookup()
 
-    note, quality = HARMONIZATION[harmonisation][mode][degree]
+def recognize_chord(pc_set, use_flats=None):
+    """Return name of the chord of a pitch class set or None.
 
-    if not isinstance(quality, str):
-        quality = quality[0]
+    The root is spelled with flats or sharps as 'use_flats' says,
+    when None as by note_name().
+    """
+    found = CHORD_LOOKUP[pc_set & 0xfff]
+    if found is None:
+        return None
+    root, quality = found
+    if use_flats is None:
+        return note_name(root) + quality
+    return NOTES[use_flats][root] + quality
 
-    chord_root = (root_note + note) % 12
+# 'pc_sets' are the sets of all the alternatives named, 'pc_set' of the first
+Chord = namedtuple("Chord", "name notes pc_set pc_sets")
 
-    return [chord_root + n for n in CHORD_NOTES[quality]]
+def _harmonize(root_note, mode, degrees):
+    """Return tuple of Chords of a harmonized scale."""
+    use_flats = scale_uses_flats(root_note, mode)
+    chords = []
+    for note, qualities in degrees:
+        if isinstance(qualities, str):
+            qualities = (qualities,)
+        chord_root = (root_note + note) % 12
+        name = NOTES[use_flats][chord_root]
+        quality = qualities[0]
+        chords.append(Chord(" or ".join((name + q) for q in qualities),
+                            tuple(chord_root + n for n in CHORD_NOTES[quality]),
+                            transpose_set(CHORD_SETS[quality], chord_root),
+                            frozenset(transpose_set(CHORD_SETS[q], chord_root)
+                                      for q in qualities)))
+    return tuple(chords)
+
+# CHORDS[harmonisation, mode][root_note][degree]
+CHORDS = {(harmonisation, mode): tuple(_harmonize(root_note, mode, degrees)
+                                       for root_note in range(12))
+          for harmonisation, modes in HARMONIZATION.items()
+          for mode, degrees in modes.items()}
+
+def scale_set(root, mode):
+    """Return pitch class set of a scale."""
+    if not isinstance(root, int):
+        root = NOTE_NUMBERS[root]
+    return transpose_set(SCALE_SETS[mode], root)
+
+def chord(root, degree, mode, harmonisation="triads"):
+    """Return Chord build on given degree of a root-mode scale."""
+    if not isinstance(root, int):
+        root = NOTE_NUMBERS[root]
+    return CHORDS[harmonisation, mode][root][degree]
+
+def chord_name(root, degree, mode, harmonisation="triads"):
+    """Return name of a chord build on given degree of a root-mode scale."""
+    return chord(root, degree, mode, harmonisation).name
+
+def chord_notes(root, degree, mode, harmonisation="triads"):
+    """Return notes of a chord build on given degree of a root-mode scale."""
+    return chord(root, degree, mode, harmonisation).notes
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""Event stream optimization.
+
+A pass over the rendered event stream, run before the events are
+queued for sending, so fewer messages reach the MIDI port and less time
+is spent sending them.
+"""
+
+from .midi import encode_running_status
+from .tracks import CH_DRUMS
+
+DRUM_CHANNEL = CH_DRUMS - 1 # as in the status byte
+
+# positions closer than that (in bars) are the same time
+SAME_TIME = 1e-9
+
+def _is_note_off(message):
+    """Check if a message is a note-off (or a zero velocity note-on)."""
+    kind = message[0] & 0xf0
+    return kind == 0x80 or kind == 0x90 and not message[2]
+
+def _flush(result, pos, offs, ons, bursts):
+    """Append events of a single time to the 'result' list."""
+    messages = offs + ons
+    if bursts and len(messages) > 1:
+        result.append((pos, encode_running_status(messages)))
+    else:
+        result.extend((pos, message) for message in messages)
+
+def optimize_stream(stream, bursts=False):
+    """Optimize a stream of event lists, as made by render.stream_events().
+
+    Yields the same lists of (position, message) events with:
+
+    - note-offs on the General MIDI drum channel removed (drums ignore
+      them),
+    - duplicate note-ons and note-offs of the same time removed,
+    - note-offs put before note-ons of the same time.
+
+    Notes started again while still sounding are handled by
+    stream_events(), which knows which note-off belongs to which note.
+
+    With 'bursts' set, events of the same time are merged into a single
+    message: a bytes object using running status.
+    """
+    for chunk in stream:
+        result = []
+        group_pos = None
+        offs = []
+        ons = []
+        started = set()
+        for pos, message in chunk:
+            if group_pos is None or pos - group_pos >= SAME_TIME:
+                if group_pos is not None:
+                    _flush(result, group_pos, offs, ons, bursts)
+                    offs = []
+                    ons = []
+                    started = set()
+                group_pos = pos
+            status = message[0]
+            if status >= 0xa0 or status < 0x80:
+                ons.append(message)
+                continue
+            if _is_note_off(message):
+                if status & 0x0f == DRUM_CHANNEL or message in offs:
+                    continue
+                offs.append(message)
+                continue
+            key = (status & 0x0f, message[1])
+            if key in started:
+                # the same note started twice
+                continue
+            started.add(key)
+            ons.append(message)
+        if group_pos is not None:
+            _flush(result, group_pos, offs, ons, bursts)
+        yield result
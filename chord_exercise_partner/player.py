@@ -5,21 +5,24 @@
 import re
 import threading
 import time
+from collections import deque, namedtuple
 
+from .backends import BackendError, RtMidiBackend
+from .events import EventQueue
+from .midi import ALL_SOUND_OFF
+from .optimize import optimize_stream
+from .realtime import GCPause, set_cpu_affinity, set_realtime_scheduling
 from .exercise import LEAD_IN
-from .midi import MIDDLE_C, note_off, note_on
-from .tracks import LEAD_TRACK, MAIN_TRACKS, MIDI_INIT
+from .render import render_bar, stream_events, warm_up
+from .stats import PlayerStats
+from .tempo import TempoClock, TempoMap
+from .tracks import MIDI_INIT
+from .wait import choose_wait_strategy
 
 # play notes that early or late, compensating for sleep time precision
 ALLOW_EARLY = 0.001  # seconds
 ALLOW_LATE = 0.020   # seconds
 
-try:
-    import rtmidi
-except ImportError as err:
-    rtmidi = None
-    rtmidi_import_error = err # pylint: disable=invalid-name
-
 # weights for sorting MIDI ports, to choose the optimal one
 PORT_WEIGHTS = [
     (re.compile("^Midi Through"), 10),
@@ -28,6 +31,41 @@ PORT_WEIGHTS = [
 
 VIRT_PORT_NAME = "Chord Exercise Partner"
 
+# how often the idle player checks for quit
+IDLE_TIMEOUT = 0.1 # seconds
+
+# exercises of the song kept for restarting the stream
+KEEP_PARTS = 4
+
+def _precise_time(wall_time):
+    """Convert time.time() timestamp to time.perf_counter() timestamp."""
+    return time.perf_counter() + wall_time - time.time()
+
+class PlaybackPosition(namedtuple("PlaybackPosition",
+                                  "session playing bar beat event_pos event_time"
+                                  " clock")):
+    """Snapshot of the player position.
+
+    'session' is the number returned by CompPlayer.start() for the
+    playback. 'event_pos' (song position in bars, also as 'bar' and 'beat') is
+    the position of the last event sent, at 'event_time'
+    (time.perf_counter()). 'clock' is the player TempoClock, so the
+    position can be extrapolated.
+    """
+    __slots__ = ()
+
+    def position_at(self, when):
+        """Return song position (in bars) played at given perf_counter() time."""
+        return self.clock.position_at(when)
+
+    @property
+    def tempo(self):
+        """Tempo at the last event sent."""
+        return self.clock.tempo_at(self.event_pos)
+
+STOPPED = PlaybackPosition(0, False, 0, 0.0, 0.0, 0.0,
+                           TempoClock(TempoMap(1.0, 1.0), 0.0))
+
 class MIDINotAvailable(Exception):
     """Raised when MIDI output is not available."""
     pass
@@ -36,50 +74,137 @@ class CompPlayer:
     """Backing track player.
 
     A MIDI sequencer, running in a separate thread for precise timing.
+
+    The thread wait strategy is chosen according to the sleep precision
+    from 'calibration' (timing.Calibration), unless 'wait_strategy'
+    names one of wait.WAIT_STRATEGIES. When the calibration is measured
+    again, the wait strategy is chosen again. Events played too late
+    are reported to the calibration.
+
+    Timing statistics are collected for each playback, available via
+    get_stats() and appended to 'stats_file' (if given) as JSON lines.
+
+    MIDI output goes through 'backend' (see the backends module),
+    RtMidiBackend by default.
+
+    With 'realtime' set the player thread asks for real-time scheduling
+    and a dedicated CPU, the garbage collector is held back during
+    playback and the rendering caches are filled before it starts.
+    What took effect is reported in 'realtime_status'.
+
+    The control methods (start(), stop(), change_*()) do not block:
+    they queue commands, which the player thread runs between events.
+    The player state is modified only by the player thread.
+
+    When an exercise ends, the player continues with the next exercise
+    queued with queue_exercise() or, in the loop mode (set_loop()), with
+    the same exercise again. The next exercise is joined to the event
+    stream without a lead-in or a gap.
+
+    The player thread publishes its position as a PlaybackPosition in
+    the 'position' attribute. It is replaced, never modified, so it can
+    be read from any thread without locking.
     """
-    def __init__(self):
-        self.exercise = None
-        self.start_time = None    # wall clock start time
-        self.p_start_time = None  # precise start time (probably meaningful
-                                  # only in the player thread)
-        self.quit = False
-        self.port = None
-        self.port_name = None
-        self.available_ports = []
-        self.thread = None
-        self.track_name = None
-        self.tempo = None
-        self.update = False
+    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-arguments
+    def __init__(self, calibration=None, wait_strategy=None, stats_file=None,
+                 backend=None, realtime=False):
+        self._init_state(calibration, stats_file, realtime)
 
-        if not rtmidi:
-            raise MIDINotAvailable("rtmidi module not available: {}"
-                                   .format(rtmidi_import_error))
+        if backend is None:
+            try:
+                backend = RtMidiBackend()
+            except BackendError as err:
+                raise MIDINotAvailable(str(err))
+        self.backend = backend
 
         try:
-            midi, ports = self._get_available_ports()
-        except rtmidi.RtMidiError as err:
+            ports = self._get_available_ports()
+        except BackendError as err:
             raise MIDINotAvailable("Could not find MIDI ports: {}".format(err))
 
         if ports:
             port_num = ports[0][0]
-            print("Selected MIDI port:", ports[port_num])
+            print("Selected MIDI port:", ports[0][1])
             try:
-                self.port = midi.open_port(port_num)
+                self.port = backend.open_port(port_num)
                 self.port_name = ports[0][1]
-            except rtmidi.RtMidiError as err:
+            except BackendError as err:
                 print("Could not open MIDI port: {}".format(err))
 
         if not self.port:
             print("Opening virtual midi port")
             try:
-                self.port = midi.open_virtual_port(VIRT_PORT_NAME)
-            except rtmidi.RtMidiError as err:
+                self.port = backend.open_virtual_port(VIRT_PORT_NAME)
+            except BackendError as err:
                 raise MIDINotAvailable("Could not open virtual MIDI port: {}"
                                        .format(err))
             self.port_name = "<virtual>"
 
-        self.lock = threading.Lock()
-        self.cond = threading.Condition(self.lock)
+        self.wait_strategy = wait_strategy
+        self.waiter = self._create_waiter(wait_strategy)
+        print("Player wait strategy:", self.waiter.name)
+        if calibration:
+            calibration.add_listener(self._calibrated)
+        self._start_thread()
+
+    def _init_state(self, calibration, stats_file, realtime):
+        """Initialize the playback state."""
+        self.exercise = None
+        self.start_time = None    # wall clock start time
+        self.clock = None         # song position <-> time.perf_counter()
+        self.quit = False
+        self.port = None
+        self.port_name = None
+        self.port_ready = False   # MIDI_INIT sent to the port
+        self.available_ports = []
+        self.thread = None
+        self.track_name = None
+        self.tempo = None
+        self.looping = False  # loop mode
+        self.playlist = deque()   # exercises to play next
+        self.parts = []           # (song bar, exercise) of the song
+        self.update = False
+        self.calibration = calibration
+        self.stats = PlayerStats()
+        self.last_stats = None
+        self.stats_file = stats_file
+        self.position = STOPPED
+        self.session = 0
+        self.started_session = 0  # the last session _start() has run for
+        self.commands = deque()
+        self.wakeup = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.idle_lock = threading.Lock()
+        self.realtime = realtime
+        self.realtime_status = {}
+        self.gc_pause = GCPause()
+        self.events = EventQueue()
+        self.stream = None
+        self.backend = None
+        self.wait_strategy = None
+        self.waiter = None
+
+    def _create_waiter(self, wait_strategy):
+        """Create the wait strategy of the player thread."""
+        if self.calibration:
+            sleep_precision = self.calibration.sleep_precision
+        else:
+            sleep_precision = None
+        return choose_wait_strategy(self.wakeup, sleep_precision, wait_strategy)
+
+    def _calibrated(self, _calibration):
+        """Handle new calibration results (called in the measuring thread)."""
+        self._command(self._update_waiter)
+
+    def _update_waiter(self):
+        """Replace the wait strategy, according to the new calibration."""
+        self.waiter = self._create_waiter(self.wait_strategy)
+        print("Player wait strategy:", self.waiter.name)
+
+    def _start_thread(self):
+        """Start the player thread."""
         self.thread = threading.Thread(name="comp player",
                                        daemon=True,
                                        target=self.run)
@@ -88,22 +213,23 @@ class CompPlayer:
     def __del__(self):
         """Clean up, stopping all sounds."""
         self.quit = True
+        if self.waiter:
+            self.waiter.wake()
         for _ in range(1000):
             if not self.thread:
                 break
             time.sleep(0.01)
         if self.port:
             # all notes off
-            for channel in range(0, 16):
-                self.port.send_message([0xb0 + channel, 0x78, 0])
+            for message in ALL_SOUND_OFF:
+                self.port.send_message(message)
             self.port = None
 
     def _get_available_ports(self):
-        """Return a MidiOut object and list of available ports.
+        """Return list of available ports.
 
         Ports are provided in (number, name) list, sorted by preference."""
-        midi = rtmidi.MidiOut()
-        ports = midi.get_ports()
+        ports = self.backend.get_ports()
         if not ports:
             self.available_ports = ["<virtual>"]
 
@@ -116,7 +242,7 @@ class CompPlayer:
             return 0
         sorted_ports = sorted(enumerate(ports), key=_port_pref)
         self.available_ports = [p[1] for p in sorted_ports] + ["<virtual>"]
-        return midi, sorted_ports
+        return sorted_ports
 
     def change_port(self, port_name):
         """Attempt to change current MIDI output to the named port.
@@ -125,16 +251,16 @@ class CompPlayer:
         """
         print("Change port request:", port_name)
         try:
-            midi, ports = self._get_available_ports() # always refresh the list
-        except rtmidi.RtMidiError as err:
-            print("Could not list MIDI ports")
+            ports = self._get_available_ports() # always refresh the list
+        except BackendError as err:
+            print("Could not list MIDI ports:", err)
             return False
         if port_name == self.port_name:
             return False
         if port_name == "<virtual>":
             try:
-                port = midi.open_virtual_port(VIRT_PORT_NAME)
-            except rtmidi.RtMidiError as err:
+                port = self.backend.open_virtual_port(VIRT_PORT_NAME)
+            except BackendError as err:
                 print("Could not open virtual port:", err)
                 return False
         else:
@@ -145,118 +271,345 @@ class CompPlayer:
                 print("Unknown MIDI port:", port_name)
                 return False
             try:
-                port = midi.open_port(num) # pylint: disable=undefined-loop-variable
-            except rtmidi.RtMidiError as err:
+                port = self.backend.open_port(num) # pylint: disable=undefined-loop-variable
+            except BackendError as err:
                 print("Could not open MIDI port:", err)
                 return False
 
+        self.port_name = port_name
+        self._command(self._set_port, port)
+        return True
+
+    def _set_port(self, port):
+        """Switch to a new output port."""
         self.port.close_port()
         self.port = port
-        self.port_name = port_name
+        self.port_ready = False
+
+    def _command(self, func, *args):
+        """Queue a command for the player thread and wake it up."""
+        self.commands.append((func, args))
+        self.waiter.wake()
+
+    def _run_commands(self):
+        """Run the queued commands (in the player thread)."""
+        if self.wakeup.is_set():
+            self.wakeup.clear()
+        commands = self.commands
+        while commands:
+            func, args = commands.popleft()
+            func(*args)
 
     def change_track(self, track_name):
         """Change current backing track."""
-        with self.lock:
-            self.track_name = track_name
+        self._command(self._change_track, track_name)
+
+    def _change_track(self, track_name):
+        self.track_name = track_name
+        self._warm_up_playlist()
+        if self.exercise:
+            if self.realtime:
+                for _, exercise in self.parts:
+                    warm_up(exercise, track_name)
             self.update = True
-            self.cond.notify()
 
     def change_tempo(self, tempo, start_time=None):
-        """Change current tempo and position."""
-        with self.lock:
-            self.tempo = tempo
+        """Change current tempo and position.
+
+        The new tempo is constant, replacing the rest of the tempo map.
+        Queued events are kept in song position, so nothing needs to
+        be rendered again.
+        """
+        if start_time:
+            anchor_time = _precise_time(start_time)
+        else:
+            anchor_time = None
+        self._command(self._change_tempo, tempo, start_time, anchor_time,
+                      time.perf_counter())
+
+    def _change_tempo(self, tempo, start_time, anchor_time, now):
+        self.tempo = tempo
+        if self.clock:
             if start_time and self.start_time:
                 self.start_time = start_time
-                self.p_start_time = None
-            self.update = True
-            self.cond.notify()
+                self.clock = TempoClock(TempoMap(self.clock.bar_duration, tempo),
+                                        anchor_time)
+            else:
+                self.clock = self.clock.with_tempo(tempo, now)
+
+    def change_tempo_map(self, tempo_map):
+        """Replace the tempo map (tempo.TempoMap) of current playback.
+
+        The song start time stays, so the map should agree with the
+        old one up to the current position.
+        """
+        self._command(self._change_tempo_map, tempo_map)
+
+    def _change_tempo_map(self, tempo_map):
+        if self.clock:
+            self.clock = TempoClock(tempo_map, self.clock.start_time)
 
     def prepare_track(self, pattern, bars=1, start=0):
         """Convert a backing track pattern to a list of timed MIDI events.
 
         Given number of bars will be generated, to be played from the start timestamp.
         """
-        pattern_bars = len(pattern)
         events = []
-        bar_d = self.exercise.bar_duration / self.tempo
-        whn_d = self.exercise.whole_note_duration / self.tempo
         for bar in range(bars):
-            song_bar = start + bar
-            ex_bar = song_bar - LEAD_IN
-            for bar_time, notes in pattern[bar % pattern_bars]:
-                rel_time = (song_bar + bar_time) * bar_d
-                on_time = self.p_start_time + rel_time
-                for channel, note, velocity, duration in notes:
-                    off_time = on_time + duration * whn_d
-                    if note == "chord":
-                        if ex_bar < 0 or ex_bar >= self.exercise.length:
-                            continue
-                        for chord_note in self.exercise.chord_notes(ex_bar):
-                            note = MIDDLE_C + chord_note
-                            events.append((on_time, note_on(channel, note, velocity)))
-                            events.append((off_time, note_off(channel, note)))
-                    else:
-                        events.append((on_time, note_on(channel, note, velocity)))
-                        events.append((off_time, note_off(channel, note)))
-        return sorted(events)
+            events += render_bar(pattern, self.exercise, start + bar, bar)
+        events = next(optimize_stream([sorted(events)]))
+        return [(self.clock.time_at(pos), message) for pos, message in events]
+
+    def _start_stream(self, now):
+        """Start rendering the song from the bar played at 'now'.
+
+        The previous bar is rendered too, so notes started there will
+        be stopped. The stream is optimized for the backend.
+        """
+        song_bar = max(0, int(self.clock.position_at(now)) - 1)
+        body_start, exercise = self.parts[-1]
+        while exercise is not None and exercise.length is not None:
+            end_bar = body_start + exercise.length
+            if song_bar < end_bar:
+                break
+            # resumed after the exercise end
+            exercise = self._next_part(end_bar)
+            body_start = end_bar
+        if exercise is None:
+            return iter(())
+        for body_start, exercise in reversed(self.parts):
+            if body_start <= song_bar:
+                break
+        stream = stream_events(exercise, self.track_name, song_bar,
+                               self._next_part, body_start)
+        return optimize_stream(stream, self.backend.bursts)
+
+    def _next_part(self, song_bar):
+        """Return the exercise to play from 'song_bar', when the previous one ends.
+
+        Called by the event stream, in the player thread.
+        """
+        for body_start, exercise in self.parts:
+            if body_start == song_bar:
+                # already chosen, the stream has been restarted
+                return exercise
+        if self.playlist:
+            exercise = self.playlist.popleft()
+        elif self.looping:
+            exercise = self.parts[-1][1]
+        else:
+            return None
+        self.parts.append((song_bar, exercise))
+        del self.parts[:-KEEP_PARTS]
+        return exercise
+
+    def set_loop(self, loop):
+        """Turn the loop mode on or off."""
+        self._command(self._set_loop, loop)
+
+    def _set_loop(self, loop):
+        self.looping = loop
+
+    def queue_exercise(self, exercise):
+        """Add an exercise to the playlist.
+
+        It will be played when the current exercise (or the ones queued
+        earlier) ends. It is prepared for rendering for the current
+        track here (or when the playback starts or the track changes),
+        so joining it costs the player thread no more than any other bar.
+        """
+        track_name = self.track_name
+        if track_name:
+            warm_up(exercise, track_name)
+        self._command(self._queue_exercise, exercise)
+
+    def _queue_exercise(self, exercise):
+        self.playlist.append(exercise)
+        if self.track_name:
+            # cheap, unless the track has just changed
+            warm_up(exercise, self.track_name)
+
+    def _warm_up_playlist(self):
+        """Prepare the queued exercises for rendering the current track."""
+        for exercise in self.playlist:
+            warm_up(exercise, self.track_name)
+
+    def clear_playlist(self):
+        """Remove all exercises from the playlist."""
+        self._command(self.playlist.clear)
 
     def start(self, exercise, start_time, main_track, tempo):
-        """Start the player, return the exact start time."""
-        with self.lock:
-            self.exercise = exercise
-            self.start_time = start_time
-            self.p_start_time = None
-            self.track_name = main_track
-            self.tempo = tempo
-            self.update = True
-            self.cond.notify()
-            while self.update:
-                self.cond.wait()
+        """Start playing an exercise.
+
+        'tempo' is a number or a tempo.TempoMap (for changing tempo).
+        The playlist is kept, so exercises queued before start() follow
+        this one. Return the playback session number, to be found in
+        'position' once the playback starts.
+        """
+        with self.idle_lock:
+            self.session += 1
+            session = self.session
+            self.idle.clear()
+        self._command(self._start, session, exercise, start_time,
+                      _precise_time(start_time), main_track, tempo)
+        return session
+
+    def _start(self, session, exercise, start_time, anchor_time, main_track, tempo):
+        # pylint: disable=too-many-arguments
+        self._finish_stats()
+        self.started_session = session
+        if self.realtime:
+            warm_up(exercise, main_track)
+            self.gc_pause.start()
+        self.position = STOPPED._replace(session=session)
+        self.exercise = exercise
+        self.parts = [(LEAD_IN, exercise)]
+        self.start_time = start_time
+        if isinstance(tempo, TempoMap):
+            tempo_map = tempo
+            tempo = tempo_map.tempo_at(0.0)
+        else:
+            tempo_map = TempoMap(exercise.bar_duration, tempo)
+        self.clock = TempoClock(tempo_map, anchor_time)
+        self.track_name = main_track
+        self._warm_up_playlist()
+        self.tempo = tempo
+        self.update = True
+
+    def stop(self):
+        """Stop playing current exercise track, clear the playlist."""
+        self._command(self._stop)
+
+    def _stop(self):
+        self.playlist.clear()
+        if self.exercise:
+            self._finish()
+
+    def _finish(self):
+        """Finish the playback."""
+        self.position = self.position._replace(playing=False)
+        self.start_time = None
+        self.exercise = None
+        self.update = False
+        self.gc_pause.stop()
+        self._finish_stats()
+
+    def wait_idle(self, timeout=None):
+        """Wait until the player finishes playing.
+
+        Return False on timeout.
+        """
+        return self.idle.wait(timeout)
+
+    def _publish(self, event_pos, event_time):
+        """Publish the player position (called from the player thread)."""
+        bar = int(event_pos)
+        self.position = PlaybackPosition(
+            self.position.session, True, bar, (event_pos - bar) * self.exercise.beats_in_bar,
+            event_pos, event_time, self.clock)
+
+    def get_stats(self):
+        """Return timing statistics of the current or last playback."""
+        stats = self.stats
+        if not stats.sent and not stats.dropped and self.last_stats:
+            stats = self.last_stats
+        return stats.as_dict()
+
+    def _finish_stats(self):
+        """Report statistics of a finished playback and reset them."""
+        if not self.stats.sent and not self.stats.dropped:
+            return
+        print("Playback finished:", self.stats.summary())
+        if self.stats_file:
+            try:
+                self.stats.dump(self.stats_file)
+            except OSError as err:
+                print("Could not write player statistics:", err)
+        self.last_stats = self.stats
+        self.stats = PlayerStats()
+
+    def _setup_realtime(self):
+        """Apply the real-time measures to the player thread, report them."""
+        status = {
+            "scheduling": set_realtime_scheduling(),
+            "affinity": set_cpu_affinity(),
+            "gc": self.gc_pause.describe(),
+            "warm-up": (True, "templates rendered before playback"),
+            }
+        for measure, (applied, description) in status.items():
+            print("Real-time {}: {}{}".format(measure,
+                                              "" if applied else "NOT applied, ",
+                                              description))
+        self.realtime_status = status
+
+    def _dispatch(self):
+        """Run the queued commands and send the events due.
+
+        Return the time.perf_counter() time to wait until, or None when
+        there is nothing to play.
+        """
+        self._run_commands()
+        if not self.exercise or not self.start_time:
+            with self.idle_lock:
+                # not before the last start() command has been run
+                if not self.commands and self.started_session == self.session:
+                    self.idle.set()
+            return None
+        events = self.events
+        if self.update:
+            if not self.port_ready:
+                for message in MIDI_INIT:
+                    self.port.send_message(message)
+                self.port_ready = True
+            now = time.perf_counter()
+            self.stream = self._start_stream(now)
+            events.clear()
+            # skip what should have been played already
+            position = self.clock.position_at(now - ALLOW_LATE)
+            while events.fill(self.stream) and events.next_time() < position:
+                events.pop()
+            self._publish(max(0.0, position), now)
+            self.update = False
+        if not events:
+            self._finish()
+            return time.perf_counter()
+        ev_time = self.clock.time_at(events.next_time())
+        now = time.perf_counter()
+        lag = now - ev_time
+        if lag > -ALLOW_EARLY:
+            ev_pos = events.next_time()
+            message = events.pop()
+            if lag < ALLOW_LATE:
+                if self.port:
+                    self.port.send_message(message)
+                    sent = time.perf_counter()
+                    self.stats.record(lag, sent - now)
+                    self._publish(ev_pos, sent)
+            else:
+                self.stats.drop(lag)
+                if self.calibration:
+                    self.calibration.timing_miss()
+            if not events.fill(self.stream) or self.commands:
+                return now
+            ev_time = self.clock.time_at(events.next_time())
+            now = time.perf_counter() # send_message() could eat some
+        if ev_time > now:
+            position = self.position
+            if position.clock is not self.clock:
+                # tempo changed
+                self._publish(position.event_pos, position.event_time)
+        return ev_time
 
     def run(self):
         """The main loop of the player."""
+        if self.realtime:
+            self._setup_realtime()
         try:
-            with self.lock:
-                while not self.quit:
-                    while not self.exercise:
-                        self.cond.wait(0.1)
-                    self.cond.notify()
-                    events = []
-                    while not self.quit and self.start_time and self.exercise:
-                        if self.update:
-                            now = time.time()
-                            p_now = time.perf_counter()
-                            self.p_start_time = p_now + self.start_time - now
-                            for message in MIDI_INIT:
-                                self.port.send_message(message)
-                            events = self.prepare_track(LEAD_TRACK,
-                                                        LEAD_IN)
-                            track = MAIN_TRACKS[self.track_name]
-                            events += self.prepare_track(track,
-                                                         self.exercise.length,
-                                                         LEAD_IN)
-                            self.update = False
-                        ev_time, message = events[0]
-                        now = time.perf_counter()
-                        lag = now - ev_time
-                        if lag > -ALLOW_EARLY:
-                            events = events[1:]
-                            if lag < ALLOW_LATE and self.port:
-                                self.port.send_message(message)
-                            if not events:
-                                break
-                            ev_time = events[0][0]
-                            now = time.perf_counter() # send_message() could eat some
-                        if ev_time > now:
-                            self.cond.wait(ev_time - now)
-                    self.start_time = None
-                    self.exercise = None
-                    self.cond.notify()
+            while not self.quit:
+                deadline = self._dispatch()
+                if deadline is None:
+                    self.wakeup.wait(IDLE_TIMEOUT)
+                else:
+                    self.waiter.wait_until(deadline)
         finally:
             self.thread = None
-
-    def stop(self):
-        """Stop playing current exercise track."""
-        with self.lock:
-            self.exercise = None
-            self.cond.notify()
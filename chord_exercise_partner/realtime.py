@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""Real-time tuning of the player thread.
+
+Every measure is optional: it is applied when the platform and the
+process privileges allow, otherwise the failure is reported and the
+player works as usual, only with more jitter. The functions return
+(applied, description) tuples.
+"""
+
+import gc
+import os
+
+REALTIME_PRIORITY = 50       # limited to the range allowed for the policy
+GC_GEN2_THRESHOLD = 1 << 30  # high enough for no generation 2 collection
+
+def set_realtime_scheduling(priority=REALTIME_PRIORITY):
+    """Switch the calling thread to SCHED_FIFO or SCHED_RR scheduling."""
+    if not hasattr(os, "sched_setscheduler"):
+        return False, "not supported"
+    errors = []
+    for name in ("SCHED_FIFO", "SCHED_RR"):
+        policy = getattr(os, name, None)
+        if policy is None:
+            continue
+        prio = min(max(priority, os.sched_get_priority_min(policy)),
+                   os.sched_get_priority_max(policy))
+        try:
+            os.sched_setscheduler(0, policy, os.sched_param(prio))
+        except OSError as err:
+            errors.append("{}: {}".format(name, err.strerror))
+            continue
+        return True, "{}, priority {}".format(name, prio)
+    return False, "; ".join(errors) or "not supported"
+
+def set_cpu_affinity():
+    """Pin the calling thread to a single CPU, the last one available."""
+    if not hasattr(os, "sched_setaffinity"):
+        return False, "not supported"
+    cpus = sorted(os.sched_getaffinity(0))
+    if len(cpus) < 2:
+        return False, "single CPU available"
+    try:
+        os.sched_setaffinity(0, {cpus[-1]})
+    except OSError as err:
+        return False, err.strerror
+    return True, "CPU {}".format(cpus[-1])
+
+class GCPause:
+    """Keeps the cyclic garbage collector from pausing playback.
+
+    start() moves all the existing objects to the permanent generation
+    (where gc.freeze() is available) and stops generation 2 collections,
+    stop() restores the collector settings.
+    """
+    def __init__(self):
+        self.thresholds = None
+
+    def start(self):
+        """Start a playback."""
+        if self.thresholds is not None:
+            return
+        self.thresholds = gc.get_threshold()
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+        gc.set_threshold(self.thresholds[0], self.thresholds[1],
+                         GC_GEN2_THRESHOLD)
+
+    def stop(self):
+        """Finish a playback."""
+        if self.thresholds is None:
+            return
+        gc.set_threshold(*self.thresholds)
+        if hasattr(gc, "unfreeze"):
+            gc.unfreeze()
+        self.thresholds = None
+
+    @staticmethod
+    def describe():
+        """Return (applied, description) of what start() does."""
+        if hasattr(gc, "freeze"):
+            return True, "objects frozen, generation 2 disabled during playback"
+        return True, "generation 2 disabled during playback"
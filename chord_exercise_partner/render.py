@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""Backing track rendering."""
+
+import heapq
+
+from .exercise import LEAD_IN
+from .midi import MIDDLE_C, note_off, note_on
+from .tracks import CH_DRUMS, LEAD_TRACK, MAIN_TRACKS
+
+class CompiledPattern:
+    """Backing track pattern prepared for fast rendering.
+
+    Every bar of the pattern is turned into a template: a sorted tuple
+    of (offset, message) events, for each chord played in the bar.
+    Rendering a bar is then a single pass over its template.
+    Offsets are in bars from the bar start, events starting at the next
+    bar or later (note-offs) are kept in a separate 'spill' tuple.
+    A 'notes' tuple lists the (on offset, off offset, note-off message)
+    of the notes (except drums), so a note-off can be told from another
+    one of the same key.
+    """
+    __slots__ = ("bars", "templates")
+
+    def __init__(self, pattern, whn_bars=1.0):
+        self.bars = []
+        for bar in pattern:
+            fixed = []
+            chord_slots = []
+            fixed_notes = []
+            for bar_time, notes in bar:
+                for channel, note, velocity, duration in notes:
+                    off_time = bar_time + duration * whn_bars
+                    if note == "chord":
+                        chord_slots.append((bar_time, off_time, channel, velocity))
+                        continue
+                    fixed.append((bar_time, note_on(channel, note, velocity)))
+                    fixed.append((off_time, note_off(channel, note)))
+                    if channel != CH_DRUMS:
+                        fixed_notes.append((bar_time, off_time,
+                                            note_off(channel, note)))
+            self.bars.append((tuple(fixed), tuple(chord_slots),
+                              tuple(fixed_notes)))
+        self.templates = {}
+
+    def template(self, pattern_bar, chord=None):
+        """Return (events, spill, notes) templates of a pattern bar.
+
+        'chord' is a tuple of chord notes (relative to C), to be used
+        for the "chord" placeholders, or None to skip them.
+        """
+        key = (pattern_bar % len(self.bars), chord)
+        try:
+            return self.templates[key]
+        except KeyError:
+            pass
+        fixed, chord_slots, fixed_notes = self.bars[key[0]]
+        events = list(fixed)
+        notes = list(fixed_notes)
+        if chord:
+            for on_time, off_time, channel, velocity in chord_slots:
+                for chord_note in chord:
+                    note = MIDDLE_C + chord_note
+                    events.append((on_time, note_on(channel, note, velocity)))
+                    events.append((off_time, note_off(channel, note)))
+                    if channel != CH_DRUMS:
+                        notes.append((on_time, off_time, note_off(channel, note)))
+        events.sort()
+        notes.sort()
+        inside = tuple(event for event in events if event[0] < 1.0)
+        spill = tuple(event for event in events if event[0] >= 1.0)
+        result = (inside, spill, tuple(notes))
+        self.templates[key] = result
+        return result
+
+_COMPILED = {}
+
+def compile_pattern(pattern, whn_bars=1.0):
+    """Return CompiledPattern for a pattern, compiling it only once.
+
+    'whn_bars' is the whole note duration in bars.
+    """
+    key = (id(pattern), whn_bars)
+    try:
+        return _COMPILED[key][1]
+    except KeyError:
+        pass
+    compiled = CompiledPattern(pattern, whn_bars)
+    _COMPILED[key] = (pattern, compiled)
+    return compiled
+
+class ChordTable:
+    """Chord notes of an exercise, as tuples usable for templates."""
+    # pylint: disable=too-few-public-methods
+    __slots__ = ("exercise", "length")
+
+    def __init__(self, exercise):
+        self.exercise = exercise
+        self.length = exercise.length
+
+    def __getitem__(self, ex_bar):
+        """Return chord notes tuple for an exercise bar or None."""
+        if ex_bar < 0 or (self.length is not None and ex_bar >= self.length):
+            return None
+        return self.exercise.chord_notes(ex_bar)
+
+def render_bar(pattern, exercise, song_bar, pattern_bar, chords=None):
+    """Convert a single bar of a backing track pattern to MIDI events.
+
+    Return list of (position, message) tuples for the song bar
+    'song_bar' using the bar 'pattern_bar' of the pattern. Positions are
+    in bars from the song start.
+    """
+    whn_bars = exercise.whole_note_duration / exercise.bar_duration
+    compiled = compile_pattern(pattern, whn_bars)
+    if chords is None:
+        chords = ChordTable(exercise)
+    inside, spill, _ = compiled.template(pattern_bar, chords[song_bar - LEAD_IN])
+    return ([(song_bar + offset, message) for offset, message in inside]
+            + [(song_bar + offset, message) for offset, message in spill])
+
+def song_bar_pattern(track_name, song_bar):
+    """Return (pattern, pattern_bar) to be played at given song bar."""
+    if song_bar < LEAD_IN:
+        return LEAD_TRACK, song_bar
+    return MAIN_TRACKS[track_name], song_bar - LEAD_IN
+
+def _restrikes(song_bar, notes, ends, cancelled):
+    """Find notes of a bar started again while still sounding.
+
+    Update 'ends' with the notes of the bar, mark the note-offs of the
+    notes cut in 'cancelled', return the sorted list of the note-off
+    events stopping them.
+    """
+    cuts = []
+    for on_offset, off_offset, message in notes:
+        start = song_bar + on_offset
+        end = song_bar + off_offset
+        last = ends.get(message)
+        if last is not None and last[1] > start:
+            if last[0] == start:
+                # started together (the optimizer drops the duplicate
+                # note-on), the longer one is played
+                if end < last[1]:
+                    key = (end, message)
+                    end = last[1]
+                else:
+                    key = (last[1], message)
+            else:
+                key = (last[1], message)
+                cuts.append((start, message))
+            cancelled[key] = cancelled.get(key, 0) + 1
+        ends[message] = (start, end)
+    return cuts
+
+def _drop_cancelled(chunk, cancelled):
+    """Return events of a chunk without the note-offs in 'cancelled'."""
+    result = []
+    for event in chunk:
+        count = cancelled.get(event)
+        if count:
+            if count > 1:
+                cancelled[event] = count - 1
+            else:
+                del cancelled[event]
+            continue
+        result.append(event)
+    return result
+
+def stream_events(exercise, track_name, start_bar=0, next_exercise=None,
+                  body_start=LEAD_IN):
+    """Render the lead-in and the backing track lazily, bar by bar.
+
+    Yields sorted lists of (position, message) tuples, one per song bar,
+    starting with 'start_bar'. Each list contains all the events due
+    before the next bar starts, so the lists can be simply concatenated.
+    Only the current bar and the note-offs still pending from it are kept
+    in memory. For an endless exercise the stream never ends.
+
+    A note started again while still sounding is stopped right before
+    (instead of by its own note-off, which would cut the new note short)
+    and its own note-off is dropped, so each note ends at its own time.
+
+    The exercise starts at song bar 'body_start'. When it ends,
+    'next_exercise(song_bar)' (if given) is called for the exercise to
+    continue with from that bar, without a lead-in or a gap, or None
+    to end the stream.
+    """
+    pending = []
+    ends = {}       # note-off message -> (start, end) of the last note
+    cancelled = {}  # (position, note-off message) -> number to drop
+    song_bar = start_bar
+    while True:
+        whn_bars = exercise.whole_note_duration / exercise.bar_duration
+        chords = ChordTable(exercise)
+        if exercise.length is None:
+            end_bar = None
+        else:
+            end_bar = body_start + exercise.length
+        while end_bar is None or song_bar < end_bar:
+            pattern, pattern_bar = song_bar_pattern(track_name, song_bar)
+            compiled = compile_pattern(pattern, whn_bars)
+            inside, spill, notes = compiled.template(
+                pattern_bar, chords[song_bar - body_start])
+            chunk = [(song_bar + offset, message) for offset, message in inside]
+            if pending:
+                due = []
+                while pending and pending[0][0] < song_bar + 1:
+                    due.append(heapq.heappop(pending))
+                if due:
+                    chunk = list(heapq.merge(due, chunk))
+            for offset, message in spill:
+                heapq.heappush(pending, (song_bar + offset, message))
+            cuts = _restrikes(song_bar, notes, ends, cancelled)
+            if cancelled:
+                chunk = _drop_cancelled(chunk, cancelled)
+            if cuts:
+                chunk = list(heapq.merge(chunk, cuts))
+            yield chunk
+            song_bar += 1
+        if next_exercise is None:
+            break
+        exercise = next_exercise(end_bar)
+        if exercise is None:
+            break
+        body_start = end_bar
+    chunk = [heapq.heappop(pending) for _ in range(len(pending))]
+    yield _drop_cancelled(chunk, cancelled) if cancelled else chunk
+
+def warm_up(exercise, track_name):
+    """Prepare everything needed to render an exercise backing track.
+
+    Compiles the patterns and builds the templates for all the chords
+    of the exercise scale, so rendering during playback allocates little.
+    Return number of the templates.
+    """
+    whn_bars = exercise.whole_note_duration / exercise.bar_duration
+    chords = [chord.notes for chord in exercise.chords]
+    count = 0
+    for pattern, pattern_chords in ((LEAD_TRACK, [None]),
+                                    (MAIN_TRACKS[track_name], chords)):
+        compiled = compile_pattern(pattern, whn_bars)
+        for pattern_bar in range(len(compiled.bars)):
+            for chord in pattern_chords:
+                compiled.template(pattern_bar, chord)
+                count += 1
+    return count
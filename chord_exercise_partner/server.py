@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+"""Headless multi-session player.
+
+A SessionServer plays many independent exercise sessions, each to its
+own MIDI output port, from a single scheduler thread. The next event
+time of every active session is kept in one heap, so the number of
+threads and wake-ups does not grow with the number of sessions.
+
+Usage: python -m chord_exercise_partner.server --help
+"""
+
+import argparse
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+
+from .backends import BACKENDS, BackendError
+from .exercise import Exercise
+from .midi import ALL_SOUND_OFF
+from .notes import SCALES
+from .player import IDLE_TIMEOUT, VIRT_PORT_NAME, CompPlayer
+from .timing import Calibration
+from .tracks import DEFAULT_TRACK, MAIN_TRACKS
+from .wait import WAIT_STRATEGIES, choose_wait_strategy
+
+class Session(CompPlayer):
+    """An exercise session of a SessionServer, playing to one port.
+
+    Has the CompPlayer control interface (start(), stop(), change_*(),
+    position, get_stats(), wait_idle()), but no thread of its own: the
+    commands are run and the events sent by the server thread.
+    """
+    # pylint: disable=super-init-not-called,too-many-instance-attributes
+    def __init__(self, server, name, port, port_name):
+        self._init_state(server.calibration, server.stats_file, False)
+        self.server = server
+        self.name = name
+        self.port = port
+        self.port_name = port_name
+        self.backend = server.backend
+        self.waiter = server.waiter
+        self.generation = 0 # of the scheduler heap entry
+
+    def __repr__(self):
+        return "<Session {!r} on {!r}>".format(self.name, self.port_name)
+
+    def _command(self, func, *args):
+        self.server.command(self, func, args)
+
+    def _run_commands(self):
+        # the server runs them
+        pass
+
+    def _finish_stats(self):
+        if self.stats.sent or self.stats.dropped:
+            print("Session {}:".format(self.name), end=" ")
+        super()._finish_stats()
+
+    def close(self):
+        """Stop playing, close the port and remove the session."""
+        self._command(self._close)
+
+    def _close(self):
+        if self.exercise:
+            self._finish()
+        self.server.remove_session(self)
+        for message in ALL_SOUND_OFF:
+            self.port.send_message(message)
+        self.port.close_port()
+        self.port = None
+
+class SessionServer:
+    """Plays many sessions from a single scheduler thread.
+
+    Sessions are created with open_session(). 'backend', 'calibration',
+    'wait_strategy' and 'stats_file' are as for CompPlayer.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, backend, calibration=None, wait_strategy=None,
+                 stats_file=None):
+        self.backend = backend
+        self.calibration = calibration
+        self.stats_file = stats_file
+        self.sessions = []
+        self.quit = False
+        self.commands = deque()
+        self.heap = []
+        self.counter = itertools.count()
+        self.wakeup = threading.Event()
+        self.wait_strategy = wait_strategy
+        self.waiter = self._create_waiter()
+        if calibration:
+            calibration.add_listener(self._calibrated)
+        self.thread = threading.Thread(name="session server",
+                                       daemon=True,
+                                       target=self.run)
+        self.thread.start()
+
+    def _create_waiter(self):
+        """Create the wait strategy of the server thread."""
+        if self.calibration:
+            sleep_precision = self.calibration.sleep_precision
+        else:
+            sleep_precision = None
+        return choose_wait_strategy(self.wakeup, sleep_precision,
+                                    self.wait_strategy)
+
+    def _calibrated(self, _calibration):
+        """Handle new calibration results (called in the measuring thread)."""
+        self.command(None, self._update_waiter, ())
+
+    def _update_waiter(self):
+        """Replace the wait strategy, according to the new calibration."""
+        self.waiter = self._create_waiter()
+        for session in self.sessions:
+            session.waiter = self.waiter
+        print("Server wait strategy:", self.waiter.name)
+
+    def open_session(self, port=None, name=None):
+        """Open a session playing to an output port.
+
+        'port' is a port number or name, when not given a new virtual
+        port is created. Raise BackendError when the port cannot be
+        opened.
+        """
+        if name is None:
+            name = str(len(self.sessions) + 1)
+        if port is None:
+            port_name = "{} {}".format(VIRT_PORT_NAME, name)
+            midi_port = self.backend.open_virtual_port(port_name)
+        else:
+            ports = self.backend.get_ports()
+            if isinstance(port, int):
+                number = port
+            elif port in ports:
+                number = ports.index(port)
+            else:
+                raise BackendError("Unknown MIDI port: {}".format(port))
+            midi_port = self.backend.open_port(number)
+            port_name = ports[number]
+        session = Session(self, name, midi_port, port_name)
+        self.sessions.append(session)
+        return session
+
+    def remove_session(self, session):
+        """Forget a session (called in the server thread)."""
+        self.sessions.remove(session)
+        session.generation += 1
+
+    def command(self, session, func, args):
+        """Queue a session command for the server thread."""
+        self.commands.append((session, func, args))
+        self.waiter.wake()
+
+    def _schedule(self, session, deadline):
+        """Put session in the scheduler heap, replacing the old entry."""
+        session.generation += 1
+        heapq.heappush(self.heap, (deadline, next(self.counter),
+                                   session.generation, session))
+
+    def _run_commands(self):
+        """Run the queued commands, reschedule their sessions."""
+        if self.wakeup.is_set():
+            self.wakeup.clear()
+        commands = self.commands
+        while commands:
+            session, func, args = commands.popleft()
+            func(*args)
+            if session in self.sessions:
+                self._schedule(session, time.perf_counter())
+
+    def run(self):
+        """The scheduler loop."""
+        heap = self.heap
+        try:
+            while not self.quit:
+                self._run_commands()
+                while heap and heap[0][0] <= time.perf_counter():
+                    _, _, generation, session = heapq.heappop(heap)
+                    if generation != session.generation:
+                        continue # replaced
+                    deadline = session._dispatch() # pylint: disable=protected-access
+                    if deadline is not None:
+                        heapq.heappush(heap, (deadline, next(self.counter),
+                                              generation, session))
+                    if self.commands:
+                        break
+                if self.commands:
+                    continue
+                if heap:
+                    self.waiter.wait_until(heap[0][0])
+                else:
+                    self.wakeup.wait(IDLE_TIMEOUT)
+        finally:
+            self.thread = None
+
+    def stop(self):
+        """Stop all sessions and the server thread."""
+        for session in list(self.sessions):
+            session.close()
+        while self.commands and self.thread:
+            time.sleep(0.01)
+        self.quit = True
+        self.waiter.wake()
+
+def parse_args(argv=None):
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(
+        description="Play chord exercise backing tracks to many MIDI ports.")
+    parser.add_argument("--sessions", "-n", type=int, default=1,
+                        help="number of sessions, each playing to a new"
+                             " virtual port (default: %(default)s)")
+    parser.add_argument("--port", action="append", default=[],
+                        help="play a session to this MIDI port (number or name)"
+                             ", may be repeated")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="rtmidi",
+                        help="MIDI backend (default: %(default)s)")
+    parser.add_argument("--mode", choices=list(SCALES), default="major",
+                        help="scale mode (default: %(default)s)")
+    parser.add_argument("--length", type=int, default=None,
+                        help="exercise length in bars (default: endless)")
+    parser.add_argument("--exercises", type=int, default=1,
+                        help="number of exercises played one after another,"
+                             " without gaps (default: %(default)s)")
+    parser.add_argument("--loop", action="store_true",
+                        help="repeat the last exercise until interrupted")
+    parser.add_argument("--track", choices=list(MAIN_TRACKS),
+                        default=DEFAULT_TRACK,
+                        help="backing track (default: %(default)s)")
+    parser.add_argument("--tempo", type=int, default=60,
+                        help="tempo (default: %(default)s)")
+    parser.add_argument("--wait-strategy", choices=sorted(WAIT_STRATEGIES),
+                        help="scheduler wait strategy (default: automatic)")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="append timing statistics of every session"
+                             " playback to FILE (as JSON lines)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Main entry point."""
+    args = parse_args(argv)
+    try:
+        backend = BACKENDS[args.backend]()
+    except BackendError as err:
+        print("MIDI not available:", err)
+        return 1
+    server = SessionServer(backend, Calibration().get(), args.wait_strategy,
+                           args.stats)
+    sessions = []
+    try:
+        for port in args.port:
+            if port.isdigit():
+                port = int(port)
+            sessions.append(server.open_session(port))
+        for _ in range(args.sessions - len(sessions)):
+            sessions.append(server.open_session())
+    except BackendError as err:
+        print("Could not open MIDI port:", err)
+        server.stop()
+        return 1
+    start_time = time.time() + 0.5
+    for session in sessions:
+        exercises = [Exercise(length=args.length, mode=args.mode)
+                     for _ in range(max(1, args.exercises))]
+        print("Session {}: {} on {}".format(
+            session.name, ", ".join(ex.scale_name for ex in exercises),
+            session.port_name))
+        for exercise in exercises[1:]:
+            session.queue_exercise(exercise)
+        session.set_loop(args.loop)
+        session.start(exercises[0], start_time, args.track, args.tempo)
+    try:
+        for session in sessions:
+            session.wait_idle()
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+    return 0
+
+if __name__ == "__main__":
+    main()
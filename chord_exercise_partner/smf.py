@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+"""Standard MIDI File export.
+
+Renders an exercise backing track (with the lead-in) to a type 1 MIDI
+file, without real-time playback.
+"""
+
+import struct
+
+from .render import stream_events
+from .tracks import MIDI_INIT
+
+PPQ = 480 # ticks per quarter note
+
+END_OF_TRACK = b"\xff\x2f\x00"
+
+def var_len(value):
+    """Encode a number as a MIDI variable-length quantity."""
+    result = bytearray([value & 0x7f])
+    value >>= 7
+    while value:
+        result.insert(0, 0x80 | (value & 0x7f))
+        value >>= 7
+    return bytes(result)
+
+def _chunk(kind, data):
+    """Build a MIDI file chunk."""
+    return kind + struct.pack(">I", len(data)) + data
+
+def _meta_track(exercise, track_name, tempo):
+    """Build the tempo/time signature track data."""
+    data = bytearray()
+    name = "{} - {}".format(exercise.scale_name, track_name).encode("utf-8")
+    data += b"\x00\xff\x03" + var_len(len(name)) + name
+    data += b"\x00\xff\x58\x04" + bytes([exercise.beats_in_bar, 2, 24, 8])
+    usec_per_quarter = int(round(60000000.0 / tempo))
+    data += b"\x00\xff\x51\x03" + usec_per_quarter.to_bytes(3, "big")
+    data += b"\x00" + END_OF_TRACK
+    return bytes(data)
+
+def _events_track(exercise, track_name):
+    """Build the backing track data."""
+    data = bytearray()
+    for message in MIDI_INIT:
+        data.append(0)
+        data.extend(message)
+    bar_ticks = PPQ * exercise.bar_duration / exercise.beat_duration
+    last_tick = 0
+    for chunk in stream_events(exercise, track_name):
+        for pos, message in chunk:
+            tick = int(round(pos * bar_ticks))
+            delta = tick - last_tick
+            if delta < 0x80:
+                data.append(delta)
+            else:
+                data += var_len(delta)
+            data.extend(message)
+            last_tick = tick
+    data += b"\x00" + END_OF_TRACK
+    return bytes(data)
+
+def render_midi_file(exercise, track_name, tempo):
+    """Render an exercise backing track, return MIDI file contents."""
+    header = struct.pack(">HHH", 1, 2, PPQ)
+    return (_chunk(b"MThd", header)
+            + _chunk(b"MTrk", _meta_track(exercise, track_name, tempo))
+            + _chunk(b"MTrk", _events_track(exercise, track_name)))
+
+def write_midi_file(path, exercise, track_name, tempo):
+    """Render an exercise backing track to a MIDI file."""
+    data = render_midi_file(exercise, track_name, tempo)
+    with open(path, "wb") as midi_file:
+        midi_file.write(data)
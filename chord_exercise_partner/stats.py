@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""Player timing statistics."""
+
+import json
+import time
+from array import array
+
+BIN_WIDTH = 0.0001 # seconds
+BINS = 1000        # the last one collects everything later
+
+class PlayerStats:
+    """Timing statistics of the events played.
+
+    Lateness of the events sent is collected in a fixed histogram, so
+    recording an event costs O(1) and allocates no memory.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self):
+        self.histogram = array("L", [0]) * (BINS + 1)
+        self.sent = 0
+        self.dropped = 0
+        self.min_lateness = None
+        self.max_lateness = None
+        self.total_lateness = 0.0
+        self.max_drop_lateness = None
+        self.total_send_time = 0.0
+        self.max_send_time = 0.0
+        self.start_time = time.time()
+
+    def reset(self):
+        """Clear all the statistics."""
+        self.__init__()
+
+    def record(self, lateness, send_time):
+        """Record an event sent 'lateness' seconds late.
+
+        'send_time' is the time spent sending it.
+        """
+        self.sent += 1
+        if self.min_lateness is None or lateness < self.min_lateness:
+            self.min_lateness = lateness
+        if self.max_lateness is None or lateness > self.max_lateness:
+            self.max_lateness = lateness
+        self.total_lateness += lateness
+        if lateness > 0.0:
+            self.histogram[min(int(lateness / BIN_WIDTH), BINS)] += 1
+        else:
+            self.histogram[0] += 1
+        self.total_send_time += send_time
+        if send_time > self.max_send_time:
+            self.max_send_time = send_time
+
+    def drop(self, lateness):
+        """Record an event dropped as it was 'lateness' seconds late."""
+        self.dropped += 1
+        if self.max_drop_lateness is None or lateness > self.max_drop_lateness:
+            self.max_drop_lateness = lateness
+
+    def percentile(self, percent):
+        """Return approximate lateness percentile of the events sent.
+
+        The result is the upper bound of the histogram bin.
+        """
+        if not self.sent:
+            return None
+        limit = self.sent * percent / 100.0
+        count = 0
+        for i, bin_count in enumerate(self.histogram):
+            count += bin_count
+            if count >= limit:
+                break
+        return (i + 1) * BIN_WIDTH # pylint: disable=undefined-loop-variable
+
+    def as_dict(self):
+        """Return the statistics as a dictionary of plain values."""
+        if self.sent:
+            mean_lateness = self.total_lateness / self.sent
+            mean_send_time = self.total_send_time / self.sent
+        else:
+            mean_lateness = None
+            mean_send_time = None
+        return {
+            "start_time": self.start_time,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "lateness": {
+                "min": self.min_lateness,
+                "mean": mean_lateness,
+                "max": self.max_lateness,
+                "p50": self.percentile(50),
+                "p90": self.percentile(90),
+                "p99": self.percentile(99),
+                "max_dropped": self.max_drop_lateness,
+                },
+            "send_time": {
+                "mean": mean_send_time,
+                "max": self.max_send_time,
+                },
+            }
+
+    def summary(self):
+        """Return a human-readable one-line summary."""
+        if not self.sent:
+            return "{} events sent, {} dropped".format(self.sent, self.dropped)
+        return ("{} events sent, {} dropped, lateness: p50 {:.1f} ms,"
+                " p99 {:.1f} ms, max {:.3f} ms".format(
+                    self.sent, self.dropped,
+                    self.percentile(50) * 1000, self.percentile(99) * 1000,
+                    self.max_lateness * 1000))
+
+    def dump(self, path):
+        """Append the statistics as a JSON line to a file."""
+        with open(path, "at") as stats_file:
+            stats_file.write(json.dumps(self.as_dict()) + "\n")
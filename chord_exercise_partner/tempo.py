@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""Conversion between song position and time."""
+
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+
+class TempoMap:
+    """Maps song position (in bars) to time (in seconds from position 0) and back.
+
+    The map is a sequence of segments starting at increasing positions,
+    the last one lasting forever. In a segment the tempo is constant or
+    changes linearly with the position (a ramp). The segment start times
+    are kept too (sums of the previous segment durations), so both
+    conversions are a binary search and a simple formula.
+
+    'bar_duration' is in 1/bpm units (as Exercise.bar_duration).
+    A map is not modified once built: changed(), stepped() and ramped()
+    return new maps.
+    """
+    __slots__ = ("bar_duration", "positions", "times", "tempos", "slopes")
+
+    def __init__(self, bar_duration, tempo):
+        if tempo <= 0:
+            raise ValueError("Tempo must be positive")
+        self.bar_duration = bar_duration
+        self.positions = array("d", [0.0])
+        self.times = array("d", [0.0])
+        self.tempos = array("d", [tempo])
+        self.slopes = array("d", [0.0])  # tempo change per bar
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __repr__(self):
+        return "<TempoMap {}>".format(", ".join(
+            "{:g}: {:g}{}".format(pos, tempo, "+{:g}/bar".format(slope) if slope else "")
+            for pos, tempo, slope in zip(self.positions, self.tempos, self.slopes)))
+
+    def _segment(self, index):
+        """Return (pos0, time0, tempo0, slope) of segment 'index' (clamped)."""
+        if index < 0:
+            # before the map start: the first tempo
+            return self.positions[0], self.times[0], self.tempos[0], 0.0
+        return (self.positions[index], self.times[index],
+                self.tempos[index], self.slopes[index])
+
+    def time_at(self, pos):
+        """Return time at which given song position is played."""
+        pos0, time0, tempo0, slope = self._segment(
+            bisect_right(self.positions, pos) - 1)
+        if not slope:
+            return time0 + (pos - pos0) * self.bar_duration / tempo0
+        tempo = tempo0 + slope * (pos - pos0)
+        return time0 + math.log(tempo / tempo0) * self.bar_duration / slope
+
+    def position_at(self, when):
+        """Return song position played at given time."""
+        pos0, time0, tempo0, slope = self._segment(
+            bisect_right(self.times, when) - 1)
+        if not slope:
+            return pos0 + (when - time0) * tempo0 / self.bar_duration
+        return pos0 + tempo0 * math.expm1((when - time0) * slope / self.bar_duration) / slope
+
+    def tempo_at(self, pos):
+        """Return tempo at given song position."""
+        pos0, _, tempo0, slope = self._segment(
+            bisect_right(self.positions, pos) - 1)
+        return tempo0 + slope * (pos - pos0)
+
+    def _truncated(self, pos):
+        """Return copy of the map without the segments starting at 'pos'
+        or later (the first one is always kept)."""
+        result = TempoMap.__new__(TempoMap)
+        result.bar_duration = self.bar_duration
+        count = max(1, bisect_left(self.positions, pos))
+        result.positions = self.positions[:count]
+        result.times = self.times[:count]
+        result.tempos = self.tempos[:count]
+        result.slopes = self.slopes[:count]
+        return result
+
+    def _append(self, pos, tempo, slope):
+        """Add a segment starting at 'pos' (only while building a new map)."""
+        if tempo <= 0:
+            raise ValueError("Tempo must be positive")
+        when = self.time_at(pos)
+        if pos <= self.positions[-1]:
+            if len(self.positions) == 1:
+                # the map starts here
+                self.positions[0] = pos
+                self.times[0] = when
+                self.tempos[0] = tempo
+                self.slopes[0] = slope
+                return
+            raise ValueError("Segments must start at increasing positions")
+        self.positions.append(pos)
+        self.times.append(when)
+        self.tempos.append(tempo)
+        self.slopes.append(slope)
+
+    def stepped(self, pos, tempo):
+        """Return new map, with constant 'tempo' from position 'pos' on."""
+        result = self._truncated(pos)
+        result._append(pos, tempo, 0.0) # pylint: disable=protected-access
+        return result
+
+    def changed(self, tempo, when):
+        """Return new map, with constant 'tempo' from time 'when' on."""
+        return self.stepped(self.position_at(when), tempo)
+
+    def ramped(self, pos, end_pos, end_tempo):
+        """Return new map, the tempo changing linearly from position 'pos'
+        to 'end_tempo' at 'end_pos', constant from there."""
+        # pylint: disable=protected-access
+        if end_pos <= pos:
+            raise ValueError("Ramp must end after it starts")
+        result = self._truncated(pos)
+        tempo = self.tempo_at(pos)
+        result._append(pos, tempo, (end_tempo - tempo) / (end_pos - pos))
+        result._append(end_pos, end_tempo, 0.0)
+        return result
+
+def accelerando(tempo_map, pos, step, period, max_tempo):
+    """Return new map with tempo rising from position 'pos' on.
+
+    The tempo rises by 'step' over every 'period' bars (repetition of
+    the chord progression), until it gets to 'max_tempo'.
+    """
+    # pylint: disable=protected-access
+    if step <= 0 or period <= 0:
+        raise ValueError("Step and period must be positive")
+    result = tempo_map._truncated(pos)
+    tempo = tempo_map.tempo_at(pos)
+    slope = step / period
+    if tempo < max_tempo:
+        result._append(pos, tempo, slope)
+        pos += (max_tempo - tempo) / slope
+        tempo = max_tempo
+    result._append(pos, tempo, 0.0)
+    return result
+
+class TempoClock:
+    """Maps song position (in bars) to clock time and back.
+
+    A TempoMap with the song position 0 played at 'start_time'.
+    Not modified once built, with_tempo() returns a new clock.
+    """
+    __slots__ = ("tempo_map", "start_time")
+
+    def __init__(self, tempo_map, start_time):
+        self.tempo_map = tempo_map
+        self.start_time = start_time
+
+    @property
+    def bar_duration(self):
+        """Bar duration in 1/bpm units."""
+        return self.tempo_map.bar_duration
+
+    def time_at(self, pos):
+        """Return time at which given song position is played."""
+        return self.start_time + self.tempo_map.time_at(pos)
+
+    def position_at(self, when):
+        """Return song position played at given time."""
+        return self.tempo_map.position_at(when - self.start_time)
+
+    def tempo_at(self, pos):
+        """Return tempo at given song position."""
+        return self.tempo_map.tempo_at(pos)
+
+    def with_tempo(self, tempo, when):
+        """Return new clock with the tempo changed at 'when'."""
+        return TempoClock(self.tempo_map.changed(tempo, when - self.start_time),
+                          self.start_time)
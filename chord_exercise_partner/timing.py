@@ -3,8 +3,13 @@
 """Functions to test platform's timing functions precision and characteristics.
 """
 
+import json
+import os
+import platform
+import sys
 import threading
 import time
+import weakref
 
 
 def check_time_resolution(func=time.time):
@@ -29,8 +34,11 @@ def check_time_resolution(func=time.time):
 
 SLEEP_SAMPLES = [0.033333, 0.01, 0.0033333, 0.001, 0.00033333, 0.0001, 0.0]
 
-def check_sleep_precision():
-    """Measure threading.Condition.wait() time precision."""
+def check_sleep_precision(verbose=True):
+    """Measure threading.Condition.wait() time precision.
+
+    The results are printed as a table, when 'verbose' is set.
+    """
     cond = threading.Condition()
     report = ["{:^12} {:^20}".format("interval", "error"),
               "{:^12} {:^6} {:^6} {:^6}".format("", "min", "mean", "max")]
@@ -51,9 +59,174 @@ def check_sleep_precision():
             result = max(result, mean)
             report.append("{:12.6f} {:^6.3f} {:^6.3f} {:^6.3f}"
                           .format(interval * 1000, min_v * 1000, mean * 1000, max_v * 1000))
-    print("Thread sleep precision (ms):\n" + "\n".join(report))
+    if verbose:
+        print("Thread sleep precision (ms):\n" + "\n".join(report))
     return result
 
+CALIBRATION_VERSION = 1
+CALIBRATION_MAX_AGE = 7 * 24 * 3600 # seconds
+
+# re-measure after that many events played too late
+MAX_TIMING_MISSES = 10
+
+def cache_dir():
+    """Return the directory for cached data."""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "chord_exercise_partner")
+
+def platform_key():
+    """Return description of the platform the measurements are valid for."""
+    return {
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "kernel": "{} {}".format(platform.system(), platform.release()),
+        }
+
+class Calibration:
+    """Timing measurements, cached on disk.
+
+    The cached values are valid for the same host, Python version and
+    kernel only. They are measured again in background when too old or
+    when the player reports timing misses, and the users of the values
+    (see add_listener()) are notified of the new ones.
+    """
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(cache_dir(), "timing.json")
+        self.path = path
+        self.time_resolution = None
+        self.precise_time_resolution = None
+        self.sleep_precision = None
+        self.timestamp = None
+        self.misses = 0
+        self.thread = None
+        self.listeners = []
+
+    @property
+    def stale(self):
+        """True when the measurements are missing or too old."""
+        if self.timestamp is None:
+            return True
+        return time.time() - self.timestamp > CALIBRATION_MAX_AGE
+
+    def add_listener(self, method):
+        """Call 'method' (a bound method) with the Calibration after each
+        measurement, in the measuring thread.
+
+        Only a weak reference is kept, so the listener object can be
+        destroyed as usual.
+        """
+        self.listeners.append(weakref.WeakMethod(method))
+
+    def _notify(self):
+        """Pass the new measurements to the listeners."""
+        for ref in list(self.listeners):
+            method = ref()
+            if method is None:
+                self.listeners.remove(ref)
+            else:
+                method(self)
+
+    def load(self):
+        """Load cached measurements. Return True on success."""
+        try:
+            with open(self.path, "rt") as cache_file:
+                data = json.load(cache_file)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as err:
+            print("Could not load timing calibration:", err)
+            return False
+        if data.get("version") != CALIBRATION_VERSION:
+            return False
+        if data.get("key") != platform_key():
+            print("Timing calibration is for a different platform")
+            return False
+        try:
+            self.time_resolution = float(data["time_resolution"])
+            self.precise_time_resolution = float(data["precise_time_resolution"])
+            self.sleep_precision = float(data["sleep_precision"])
+            self.timestamp = float(data["timestamp"])
+        except (KeyError, TypeError, ValueError):
+            return False
+        return True
+
+    def save(self):
+        """Store the measurements in the cache."""
+        data = {
+            "version": CALIBRATION_VERSION,
+            "key": platform_key(),
+            "timestamp": self.timestamp,
+            "time_resolution": self.time_resolution,
+            "precise_time_resolution": self.precise_time_resolution,
+            "sleep_precision": self.sleep_precision,
+            }
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wt") as cache_file:
+                json.dump(data, cache_file, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            print("Could not save timing calibration:", err)
+
+    def measure(self, verbose=True):
+        """Measure the timing characteristics and store the results.
+
+        The sleep precision measurements are printed when 'verbose'
+        is set.
+        """
+        time_res = check_time_resolution()
+        precise_time_res = check_time_resolution(time.perf_counter)
+        sleep_prec = check_sleep_precision(verbose)
+        self.time_resolution = time_res
+        self.precise_time_resolution = precise_time_res
+        self.sleep_precision = sleep_prec
+        self.timestamp = time.time()
+        self.misses = 0
+        self.save()
+        self._notify()
+
+    def measure_in_background(self):
+        """Start measurement in a separate thread, unless already running.
+
+        Nothing is printed, unless the results cannot be saved.
+        """
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(name="timing calibration",
+                                       daemon=True,
+                                       target=self.measure,
+                                       args=(False,))
+        self.thread.start()
+
+    def timing_miss(self):
+        """Report an event played too late.
+
+        Repeated misses suggest the measurements are no longer valid,
+        so they are repeated.
+        """
+        self.misses += 1
+        if self.misses == MAX_TIMING_MISSES:
+            print("Too many timing misses, measuring timing again")
+            self.measure_in_background()
+
+    def get(self):
+        """Return valid measurements, loading or measuring them as needed.
+
+        Stale measurements are returned, but refreshed in background.
+        """
+        if self.timestamp is None and not self.load():
+            self.measure()
+        elif self.stale:
+            self.measure_in_background()
+        return self
+
 if __name__ == "__main__":
     # pylint: disable=invalid-name
     time_res = check_time_resolution(time.time)
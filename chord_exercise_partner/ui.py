@@ -2,14 +2,20 @@
 
 """C.E.P. UI implementation."""
 
+import argparse
+import math
+import sys
+import threading
 import time
 import tkinter as tk
 
 from .exercise import DEFAULT_LENGTH, LEAD_IN, Exercise
-from .notes import HARMONIZATION, SCALES, normalize_scale_root
-from .player import CompPlayer, MIDINotAvailable
-from .progressions import get_progression, get_progressions, progression_length
-from .timing import check_sleep_precision, check_time_resolution
+from .notes import (HARMONIZATION, SCALES, normalize_scale_root,
+                    scale_uses_flats)
+from .progressions import (PROGRESSIONS, get_progression, get_progressions,
+                           progression_length)
+from .tempo import TempoMap, accelerando
+from .timing import Calibration
 from .tracks import DEFAULT_TRACK, MAIN_TRACKS
 
 ROMAN = ["I", "II", "III", "IV", "V", "VI", "VII"]
@@ -44,20 +50,84 @@ MIN_TEMPO = 20
 MAX_TEMPO = 200
 DEFAULT_TEMPO = 60
 
+# accelerando trainer tempo increase per progression repetition
+ACCELERANDO_STEP = 5
+# bars of a repetition, when the progression is random
+ACCELERANDO_PERIOD = 4
+
+# the asyncio player (async def, loop.create_future()) needs that
+ENGINES = ["thread", "asyncio"] if sys.version_info >= (3, 5, 2) else ["thread"]
+
+PLAYER_POLL_INTERVAL = 50 # ms
+INPUT_POLL_INTERVAL = 50 # ms
+
+VIRTUAL_INPUT = "virtual"
+
+DEFAULT_FRAME_RATE = 60 # Hz
+
+ENDLESS = "endless"
+
+def exercise_bar(exercise, song_bar):
+    """Return exercise bar played at a song bar (the exercise may loop)."""
+    ex_bar = song_bar - LEAD_IN
+    if exercise.length is not None and ex_bar >= 0:
+        ex_bar %= exercise.length
+    return ex_bar
+
+def label_timeline(exercise, start_bar=0, end_bar=None):
+    """Generate chord label changes of an exercise, from 'start_bar' on.
+
+    Yields (position, label, text) tuples in position order, 'label'
+    being the name of the CEPApplication label attribute to update.
+    Positions are in the exercise time units (1/bpm), from the song start.
+    The song ends at 'end_bar', the exercise is looped until then. With
+    'end_bar' of None the timeline never ends.
+    """
+    bar = start_bar
+    while end_bar is None or bar < end_bar:
+        pos = bar * exercise.bar_duration
+        ex_bar = exercise_bar(exercise, bar)
+        if ex_bar >= 0:
+            yield pos, "chord_d_l", ROMAN[exercise.progression[ex_bar]]
+            yield pos, "chord_n_l", "?"
+        if ex_bar >= -1 and (end_bar is None or bar + 1 < end_bar):
+            next_bar = exercise_bar(exercise, bar + 1)
+            yield pos, "n_chord_d_l", ROMAN[exercise.progression[next_bar]]
+            yield pos, "n_chord_n_l", "?"
+        if ex_bar >= 0:
+            yield (pos + CHORD_NAME_DELAY * exercise.beat_duration,
+                   "chord_n_l", exercise.chord_name(ex_bar))
+        bar += 1
+
 class CEPApplication(tk.Frame):
     """Application window."""
     # pylint: disable=too-many-ancestors,too-many-instance-attributes
-    def __init__(self, master=None):
+    # pylint: disable=too-many-public-methods
+    def __init__(self, master=None, calibration=None, player_options=None,
+                 frame_rate=DEFAULT_FRAME_RATE):
         super().__init__(master)
         self.start_time = None
-        self.end_time = None
-        self.bar = None
-        self.beat = None
         self.exercise = None
+        self.end_bar = None
         self.tempo = DEFAULT_TEMPO
+        self.tempo_map = None
+        self.shown_tempo = None
+        self.period = ACCELERANDO_PERIOD
+        self.latency = 0.0
         self.paused_at = None
+        self.frame_rate = frame_rate
+        self.next_frame = None
+        self.frame_after = None
+        self.labels = None
+        self.next_label = None
+        self.label_after = None
+        self.bar_items = []
+        self.first_bar = None
 
         self.tempo_s = None
+        self.tempo_l = None
+        self.accelerando_v = None
+        self.loop_v = None
         self.scale_root_v = None
         self.scale_root_o = None
         self.scale_mode_v = None
@@ -75,11 +145,18 @@ class CEPApplication(tk.Frame):
         self.midi_port_o = None
         self.latency_s = None
 
-        try:
-            self.player = CompPlayer()
-        except MIDINotAvailable as err:
-            print("MIDI player not available:", err)
-            self.player = None
+        self.player = None
+        self.player_session = None
+        self.new_player = None
+        self.listener = None
+        self.new_listener = None
+        self.shown_match = None
+        self.player_thread = threading.Thread(name="player init",
+                                              daemon=True,
+                                              target=self.create_player,
+                                              args=(calibration,
+                                                    player_options or {}))
+        self.player_thread.start()
 
         self.pack(expand=1, fill=tk.BOTH)
         self.create_widgets()
@@ -87,6 +164,98 @@ class CEPApplication(tk.Frame):
 
         self.new_exercise()
         self.focus_set()
+        self.after(PLAYER_POLL_INTERVAL, self.player_ready)
+
+    def create_player(self, calibration, options):
+        """Create the backing track player.
+
+        Called in a separate thread, so the window can be shown
+        while MIDI is being initialized. 'options' are extra CompPlayer
+        arguments, except for "engine", which selects the player
+        implementation ("thread" or "asyncio") and "input_port", the MIDI
+        input port (number, name or VIRTUAL_INPUT) to listen to the chords
+        played on.
+        """
+        # imported here, as it loads the MIDI library
+        from .player import CompPlayer, MIDINotAvailable
+        options = dict(options)
+        if options.pop("engine", None) == "asyncio":
+            try:
+                from .aioplayer import AsyncCompPlayer as CompPlayer # pylint: disable=redefined-outer-name
+            except SyntaxError:
+                print("The asyncio player requires Python 3.5.2 or newer,"
+                      " using the threaded one")
+        input_port = options.pop("input_port", None)
+        try:
+            self.new_player = CompPlayer(calibration=calibration, **options)
+        except MIDINotAvailable as err:
+            print("MIDI player not available:", err)
+        if input_port is None:
+            return
+        from .backends import BackendError, RtMidiBackend
+        from .listener import open_listener
+        if input_port == VIRTUAL_INPUT:
+            input_port = None
+        elif input_port.isdigit():
+            input_port = int(input_port)
+        try:
+            self.new_listener = open_listener(RtMidiBackend(), input_port,
+                                              self.expected_chord)
+        except BackendError as err:
+            print("MIDI input not available:", err)
+
+    def player_ready(self):
+        """Enable the player controls once the player is created."""
+        if self.player_thread.is_alive():
+            self.after(PLAYER_POLL_INTERVAL, self.player_ready)
+            return
+        self.player = self.new_player
+        self.new_player = None
+        self.update_player_settings_widgets()
+        if self.new_listener:
+            self.listener = self.new_listener
+            self.new_listener = None
+            self.set_listener_key()
+            self.show_played()
+
+    def set_listener_key(self):
+        """Let the chords played be spelled as in the exercise key."""
+        if self.listener and self.exercise:
+            self.listener.use_flats = scale_uses_flats(self.exercise.root,
+                                                       self.exercise.mode)
+
+    def expected_chord(self, when):
+        """Return the exercise chord to be played at time.perf_counter()
+        time 'when', or None.
+
+        Called from the MIDI input thread. As position(), follows the
+        player position while the player plays.
+        """
+        exercise = self.exercise
+        if not self.start_time or self.paused_at is not None:
+            return None
+        snapshot = self.player.position if self.player else None
+        if (snapshot and snapshot.playing
+                and snapshot.session == self.player_session):
+            pos = snapshot.position_at(when - self.latency)
+        else:
+            now = time.time() - (time.perf_counter() - when)
+            pos = self.tempo_map.position_at(now - self.start_time - self.latency)
+        bar = exercise_bar(exercise, int(max(0.0, pos)))
+        if bar < 0 or (exercise.length is not None and bar >= exercise.length):
+            return None
+        return exercise.chords[exercise.progression[bar]]
+
+    def show_played(self):
+        """Show the last chord recognized on the MIDI input."""
+        match = self.listener.last_match
+        if match is not self.shown_match:
+            self.shown_match = match
+            text = match.chord or "?"
+            if match.expected is not None:
+                text += " ✓" if match.match else " ✗"
+            self.played_l["text"] = text
+        self.after(INPUT_POLL_INTERVAL, self.show_played)
 
     def create_widgets(self):
         """Create basic window layout and the fixed widgets."""
@@ -114,6 +283,12 @@ class CEPApplication(tk.Frame):
         self.n_chord_n_l = tk.Label(labels_f, justify=tk.LEFT, font=SCALE_NAME_FONT, width=8)
         self.n_chord_n_l.grid(row=3, column=3, sticky=tk.W)
 
+        label = tk.Label(labels_f, text="You played:", font=SCALE_LABEL_FONT, padx=5)
+        label.grid(row=4, column=0, sticky=tk.E)
+        self.played_l = tk.Label(labels_f, justify=tk.LEFT, font=SCALE_NAME_FONT)
+        self.played_l.grid(row=4, column=1, columnspan=3, sticky=tk.W)
+        self.played_l["text"] = "–"
+
         self.canvases_f = tk.Frame(self, padx=0, pady=0)
         self.top_canvas = tk.Canvas(self.canvases_f,
                                     height=CANVAS_HEIGHT / 2,
@@ -149,13 +324,20 @@ class CEPApplication(tk.Frame):
         label = tk.Label(tempo_f, text="Tempo:")
         label.pack(side=tk.LEFT)
         self.tempo_s = tk.Scale(tempo_f,
-                                from_=20.0,
-                                to=200.0,
+                                from_=MIN_TEMPO,
+                                to=MAX_TEMPO,
                                 resolution=10,
                                 orient=tk.HORIZONTAL)
         self.tempo_s.set(self.tempo)
         self.tempo_s["command"] = self.tempo_changed
         self.tempo_s.pack(side=tk.LEFT, expand=True, fill=tk.X)
+        self.accelerando_v = tk.BooleanVar(self, False)
+        button = tk.Checkbutton(tempo_f, text="Accelerando",
+                                variable=self.accelerando_v,
+                                command=self.update_tempo_map)
+        button.pack(side=tk.LEFT)
+        self.tempo_l = tk.Label(tempo_f, width=8)
+        self.tempo_l.pack(side=tk.LEFT)
 
         self.p_settings_f = tk.Frame(self)
         self.p_settings_f.pack()
@@ -177,6 +359,12 @@ class CEPApplication(tk.Frame):
         self.play_b.pack(side=tk.LEFT, padx=5, pady=5)
         self.bind("<space>", self.play_pause)
 
+        self.loop_v = tk.BooleanVar(self, False)
+        button = tk.Checkbutton(buttons_f, text="Loop",
+                                variable=self.loop_v,
+                                command=self.loop_changed)
+        button.pack(side=tk.LEFT, padx=5, pady=5)
+
         separator = tk.Frame(self,
                              borderwidth=1,
                              height=3,
@@ -293,12 +481,17 @@ class CEPApplication(tk.Frame):
         if progression == "<random>":
             options = ["{} bars".format(l) for l in range(5, 50, 5)]
         else:
-            length, options = progression_length(progression, length, 60)
+            length, options = progression_length(progression,
+                                                 length or DEFAULT_LENGTH, 60)
             options = ["{} bars".format(l) for l in options]
+        options.append(ENDLESS)
 
         if not self.length_v:
             self.length_v = tk.StringVar(self.e_settings_f2)
-        self.length_v.set("{} bars".format(length))
+        if self.exercise and self.exercise.length is None:
+            self.length_v.set(ENDLESS)
+        else:
+            self.length_v.set("{} bars".format(length))
 
         self.length_o = tk.OptionMenu(self.e_settings_f2,
                                       self.length_v,
@@ -312,15 +505,13 @@ class CEPApplication(tk.Frame):
         set depending on other settings and available resources.
         """
 
-        if self.latency_s:
-            latency = self.latency_s.get()
-        else:
-            latency = 0
-
         for widget in self.p_settings_f.winfo_children():
             widget.destroy()
 
-        if self.player:
+        if not self.player and self.player_thread.is_alive():
+            label = tk.Label(self.p_settings_f, text="Starting MIDI player…")
+            label.pack(side=tk.LEFT)
+        elif self.player:
             label = tk.Label(self.p_settings_f, text="Backing track:")
             label.pack(side=tk.LEFT)
 
@@ -360,8 +551,8 @@ class CEPApplication(tk.Frame):
                                       to=500.0,
                                       resolution=1,
                                       orient=tk.HORIZONTAL)
-            if latency:
-                self.latency_s.set(latency)
+            self.latency_s.set(self.latency * 1000)
+            self.latency_s["command"] = self.latency_changed
             self.latency_s.pack(side=tk.LEFT)
 
     def midi_port_changed(self, *args_):
@@ -378,16 +569,77 @@ class CEPApplication(tk.Frame):
     def tempo_changed(self, *args_):
         """Tempo change callback."""
         tempo = self.tempo_s.get()
-        if self.paused_at:
-            self.tempo = tempo
+        if tempo == self.tempo:
+            return
+        self.tempo = tempo
+        self.update_tempo_map()
+
+    def make_tempo_map(self, tempo_map, pos, tempo):
+        """Return 'tempo_map' continued from song position 'pos' (in bars)
+        with 'tempo'.
+
+        With the accelerando trainer on, the tempo rises from there (or
+        from the lead-in end) by ACCELERANDO_STEP with every repetition
+        of the progression.
+        """
+        tempo_map = tempo_map.stepped(pos, tempo)
+        if self.accelerando_v.get():
+            tempo_map = accelerando(tempo_map, max(pos, LEAD_IN),
+                                    ACCELERANDO_STEP, self.period, MAX_TEMPO)
+        return tempo_map
+
+    def update_tempo_map(self):
+        """Apply the tempo settings from the current position on."""
+        if not self.start_time:
             return
-        if self.start_time:
-            now = time.time()
-            rel_time = (now - self.start_time) * self.tempo
-            self.start_time = now - rel_time / tempo
-            self.tempo = tempo
+        if self.paused_at is None:
+            pos = self.tempo_map.position_at(time.time() - self.start_time)
+        else:
+            pos = self.paused_at / self.exercise.bar_duration
+        self.tempo_map = self.make_tempo_map(self.tempo_map, max(0.0, pos),
+                                             self.tempo)
+        if self.paused_at is None:
             if self.player:
-                self.player.change_tempo(tempo, self.start_time)
+                self.player.change_tempo_map(self.tempo_map)
+            self.schedule_labels()
+
+    def set_end_bar(self):
+        """Set the song end from the exercise length and the loop mode."""
+        if self.exercise.length is None or self.loop_v.get():
+            self.end_bar = None
+        else:
+            self.end_bar = LEAD_IN + self.exercise.length
+
+    def loop_changed(self):
+        """Loop checkbox callback."""
+        loop = self.loop_v.get()
+        if self.player:
+            self.player.set_loop(loop)
+        if not self.start_time or self.exercise.length is None:
+            self.set_end_bar()
+            return
+        bar = int(self.position(time.time()) // self.exercise.bar_duration)
+        if loop:
+            self.end_bar = None
+        else:
+            # finish the current repetition
+            repetition = max(0, bar - LEAD_IN) // self.exercise.length
+            self.end_bar = LEAD_IN + (repetition + 1) * self.exercise.length
+        for items in self.bar_items:
+            items[0] = None
+        self.first_bar = None
+        self.update_bars(max(0, bar - 1))
+        if self.paused_at is None:
+            self.schedule_labels()
+
+    def latency_changed(self, *args_):
+        """Latency change callback."""
+        latency = self.latency_s.get() / 1000.0
+        if latency == self.latency:
+            return
+        self.latency = latency
+        if self.start_time and self.paused_at is None:
+            self.schedule_labels()
 
     def mode_changed(self, *args_):
         """Scale mode selection widget change callback."""
@@ -403,49 +655,78 @@ class CEPApplication(tk.Frame):
         self.update_exercise_settings_widgets()
 
     def draw_canvas(self):
-        """Draw current exercise on the main canvas."""
+        """Draw current exercise on the main canvas.
+
+        Only the bars around the viewport are drawn: a pool of canvas
+        items, enough for the widest screen, is reused for the next bars
+        as the exercise progresses (see update_bars()).
+        """
 
         self.canvas.delete(tk.ALL)
 
         y_padding = (CANVAS_HEIGHT - BAR_HEIGHT) / 2
+        y = CANVAS_HEIGHT - y_padding - BEAT_RADIUS
 
-        # bars
-        y = y_padding
-        for i in range(LEAD_IN + self.exercise.length + 1):
-            x = BAR_OFFSET + i * BAR_LENGTH
-            self.canvas.create_line(x, y, x, y + BAR_HEIGHT, fill="black")
-
-        # lead-in beats
+        pool_size = self.winfo_screenwidth() // BAR_LENGTH + 3
+        self.bar_items = []
+        for _ in range(pool_size):
+            line = self.canvas.create_line(0, y_padding, 0, y_padding + BAR_HEIGHT,
+                                           fill="black")
+            ovals = [self.canvas.create_oval(0, y, 0, y, fill="black")
+                     for _ in range(4)]
+            text = self.canvas.create_text(0, y_padding,
+                                           anchor=tk.NW,
+                                           fill="black",
+                                           font=CANVAS_FONT)
+            # [song bar shown, line, beat ovals, chord number]
+            self.bar_items.append([None, line, ovals, text])
+        self.first_bar = None
+        self.update_bars(0)
+
+    def update_bars(self, first_bar):
+        """Show bars from 'first_bar' on, reusing the pooled canvas items."""
+        if first_bar == self.first_bar:
+            return
+        self.first_bar = first_bar
+        pool_size = len(self.bar_items)
+        total_bars = self.end_bar
+        y_padding = (CANVAS_HEIGHT - BAR_HEIGHT) / 2
         y = CANVAS_HEIGHT - y_padding - BEAT_RADIUS
-        for i in range(LEAD_IN):
-            for j in range(4):
-                x = BEAT_OFFSET + i * BAR_LENGTH + j * BEAT_LENGTH
-                self.canvas.create_oval(x - SMALL_BEAT_RADIUS,
-                                        y - SMALL_BEAT_RADIUS,
-                                        x + SMALL_BEAT_RADIUS,
-                                        y + SMALL_BEAT_RADIUS,
-                                        fill="black")
-
-        # exercise beats and chord numbers
-        for i in range(self.exercise.length):
-            for j in range(4):
-                x = BEAT_OFFSET + (LEAD_IN + i) * BAR_LENGTH + j * BEAT_LENGTH
-                self.canvas.create_oval(x - BEAT_RADIUS,
-                                        y - BEAT_RADIUS,
-                                        x + BEAT_RADIUS,
-                                        y + BEAT_RADIUS,
-                                        fill="black")
-            x = BEAT_OFFSET + (LEAD_IN + i) * BAR_LENGTH - BEAT_RADIUS
-            self.canvas.create_text(x, y_padding,
-                                    anchor=tk.NW,
-                                    text=ROMAN[self.exercise.progression[i]],
-                                    fill="black",
-                                    font=CANVAS_FONT)
-
-        x, y, width, height = self.canvas.bbox(tk.ALL)
-        canvas_length = width + 4096 # to be longer than any screen width
-
-        self.canvas.config(scrollregion=(0, y, canvas_length, height),
+        for bar in range(first_bar, first_bar + pool_size):
+            items = self.bar_items[bar % pool_size]
+            if items[0] == bar:
+                continue
+            items[0] = bar
+            _, line, ovals, text = items
+            past_end = total_bars is not None and bar > total_bars
+            x = BAR_OFFSET + bar * BAR_LENGTH
+            self.canvas.coords(line, x, y_padding, x, y_padding + BAR_HEIGHT)
+            self.canvas.itemconfigure(line,
+                                      state=tk.HIDDEN if past_end else tk.NORMAL)
+            if past_end or bar == total_bars:
+                for oval in ovals:
+                    self.canvas.itemconfigure(oval, state=tk.HIDDEN)
+                self.canvas.itemconfigure(text, state=tk.HIDDEN)
+                continue
+            radius = SMALL_BEAT_RADIUS if bar < LEAD_IN else BEAT_RADIUS
+            for j, oval in enumerate(ovals):
+                x = BEAT_OFFSET + bar * BAR_LENGTH + j * BEAT_LENGTH
+                self.canvas.coords(oval, x - radius, y - radius,
+                                   x + radius, y + radius)
+                self.canvas.itemconfigure(oval, state=tk.NORMAL)
+            if bar < LEAD_IN:
+                self.canvas.itemconfigure(text, state=tk.HIDDEN)
+            else:
+                x = BEAT_OFFSET + bar * BAR_LENGTH - BEAT_RADIUS
+                self.canvas.coords(text, x, y_padding)
+                self.canvas.itemconfigure(
+                    text, state=tk.NORMAL,
+                    text=ROMAN[self.exercise.progression[exercise_bar(self.exercise, bar)]])
+
+        # to be longer than any screen width
+        canvas_length = ((first_bar + pool_size) * BAR_LENGTH
+                         + self.winfo_screenwidth())
+        self.canvas.config(scrollregion=(0, 0, canvas_length, CANVAS_HEIGHT),
                            xscrollincrement='1')
 
     def draw_markers(self):
@@ -477,19 +758,26 @@ class CEPApplication(tk.Frame):
         if not self.start_time:
             print("Playing from the beginning")
             return self.start()
-        tempo = self.tempo_s.get()
         now = time.time()
+        bar_duration = self.exercise.bar_duration
         if self.paused_at is not None:
-            self.start_time = now - self.paused_at / tempo
+            self.start_time = now - self.tempo_map.time_at(self.paused_at / bar_duration)
             print("Unpausing")
             self.paused_at = None
-            track = self.track_v.get()
-            self.player.start(self.exercise, self.start_time, track, tempo)
+            if self.player:
+                track = self.track_v.get()
+                self.player_session = self.player.start(self.exercise,
+                                                        self.start_time,
+                                                        track, self.tempo_map)
             self.play_b["text"] = "Pause"
-            self.canvas.after(10, self.progress)
+            self.schedule_labels()
+            self.start_frames()
         else:
-            self.player.stop()
-            self.paused_at = (now - self.start_time) * tempo
+            if self.player:
+                self.player.stop()
+            self.cancel_updates()
+            pos = self.tempo_map.position_at(now - self.start_time)
+            self.paused_at = max(0.0, pos) * bar_duration
             self.play_b["text"] = "Play"
             print("Paused at {:.3f}".format(self.paused_at))
 
@@ -498,6 +786,7 @@ class CEPApplication(tk.Frame):
 
         if self.player:
             self.player.stop()
+        self.cancel_updates()
 
         self.play_b["text"] = "Pause"
         self.chord_d_l["text"] = "–"
@@ -505,86 +794,146 @@ class CEPApplication(tk.Frame):
         self.n_chord_d_l["text"] = "–"
         self.n_chord_n_l["text"] = "–"
 
+        self.set_end_bar()
+        for items in self.bar_items:
+            items[0] = None
+        self.first_bar = None
+        self.update_bars(0)
         self.canvas.xview_moveto(0)
 
-        song_length = (LEAD_IN + self.exercise.length) * self.exercise.bar_duration
-        print("Song length: {}s".format(song_length))
-
-        if self.latency_s:
-            latency = self.latency_s.get() / 1000.0
+        self.tempo_map = self.make_tempo_map(
+            TempoMap(self.exercise.bar_duration, self.tempo), 0.0, self.tempo)
+        if self.end_bar is None:
+            print("Song length: endless")
         else:
-            latency = 0
+            song_length = self.tempo_map.time_at(self.end_bar)
+            print("Song length: {:.1f}s".format(song_length))
 
         self.paused_at = None
-        self.start_time = time.time() + latency + 0.001
+        self.start_time = time.time() + self.latency + 0.001
         if self.player:
             track = self.track_v.get()
-            tempo = self.tempo_s.get()
-            self.player.start(self.exercise, self.start_time, track, tempo)
-
-        self.end_time = self.start_time + song_length
+            self.player.set_loop(self.loop_v.get())
+            self.player_session = self.player.start(self.exercise,
+                                                    self.start_time,
+                                                    track, self.tempo_map)
+        self.schedule_labels()
+        self.start_frames()
+
+    def position(self, now):
+        """Return exercise position (in 1/bpm units) displayed at 'now'.
+
+        While the player plays, its published position is used, so the
+        display follows what is actually played.
+        """
+        if self.player and self.paused_at is None:
+            snapshot = self.player.position
+            if snapshot.playing and snapshot.session == self.player_session:
+                pos = snapshot.position_at(time.perf_counter() - self.latency)
+                return max(0.0, pos) * self.exercise.bar_duration
+        bar_duration = self.exercise.bar_duration
+        if self.paused_at is not None:
+            when = self.tempo_map.time_at(self.paused_at / bar_duration) - self.latency
+        else:
+            when = now - self.start_time - self.latency
+        return max(0.0, self.tempo_map.position_at(when)) * bar_duration
+
+    def position_time(self, pos):
+        """Return time when exercise position 'pos' is to be displayed."""
+        return (self.start_time + self.latency
+                + self.tempo_map.time_at(pos / self.exercise.bar_duration))
+
+    def cancel_updates(self):
+        """Cancel the scheduled label updates and canvas frames."""
+        if self.label_after:
+            self.after_cancel(self.label_after)
+            self.label_after = None
+        if self.frame_after:
+            self.after_cancel(self.frame_after)
+            self.frame_after = None
+
+    def schedule_labels(self):
+        """(Re)start the chord label updates from the current position.
+
+        Needed whenever the start time, tempo or latency changes.
+        """
+        if self.label_after:
+            self.after_cancel(self.label_after)
+            self.label_after = None
+        pos = self.position(time.time())
+        bar = max(0, int(pos // self.exercise.bar_duration))
+        self.labels = label_timeline(self.exercise, bar, self.end_bar)
+        self.next_label = next(self.labels, None)
+        self.update_labels()
+
+    def update_labels(self):
+        """Apply the chord label changes due, schedule the next one."""
+        self.label_after = None
+        now = time.time()
+        while self.next_label:
+            pos, label, text = self.next_label
+            when = self.position_time(pos)
+            if when > now:
+                delay = max(1, math.ceil((when - now) * 1000))
+                self.label_after = self.after(delay, self.update_labels)
+                return
+            getattr(self, label)["text"] = text
+            self.next_label = next(self.labels, None)
+
+    def start_frames(self):
+        """Start scrolling the canvas."""
+        if self.frame_after:
+            self.after_cancel(self.frame_after)
+            self.frame_after = None
+        self.next_frame = time.time()
         self.progress()
 
     def progress(self):
-        """Update window as the exercise progresses.
+        """Scroll the canvas as the exercise progresses.
 
-        Scroll the canvas and show current chords.
+        Called once per frame: as often as needed to move the canvas by
+        a single pixel, but no more often than the display refreshes.
         """
+        self.frame_after = None
 
         if not self.start_time:
             # exercise stopped
             return
 
         now = time.time()
-        total_bars = LEAD_IN + self.exercise.length
-        if self.latency_s:
-            latency = self.latency_s.get() / 1000.0
-        else:
-            latency = 0
+        pos = self.position(now)
+        bar = int(pos // self.exercise.bar_duration)
 
-        tempo = self.tempo_s.get()
+        self.update_bars(max(0, bar - 1))
 
-        if self.paused_at is not None:
-            pos = self.paused_at - latency * tempo
-        else:
-            pos = now - self.start_time - latency
-            if pos < 0:
-                pos = 0
-            pos *= tempo
-
-        bar = int(pos // self.exercise.bar_duration)
-        beat = (pos % self.exercise.bar_duration) / self.exercise.beat_duration
-
-        if bar != self.bar and bar < total_bars:
-            self.bar = bar
-            if bar >= LEAD_IN:
-                chord_degree = self.exercise.progression[bar - LEAD_IN] + 1
-                self.chord_d_l["text"] = ROMAN[chord_degree - 1]
-                self.chord_n_l["text"] = "?"
-            if bar >= LEAD_IN - 1 and bar < total_bars - 1:
-                chord_degree = self.exercise.progression[bar - LEAD_IN + 1] + 1
-                self.n_chord_d_l["text"] = ROMAN[chord_degree - 1]
-                self.n_chord_n_l["text"] = "?"
-
-
-        if beat != self.beat and bar < total_bars:
-            self.beat = beat
-            if bar >= LEAD_IN and beat >= CHORD_NAME_DELAY:
-                chord_name = self.exercise.chord_names[bar - LEAD_IN]
-                self.chord_n_l["text"] = chord_name
-
-        canvas_target = int(bar * BAR_LENGTH + beat * BEAT_LENGTH)
+        canvas_target = int(pos * BAR_LENGTH / self.exercise.bar_duration)
         canvas_x = int(self.canvas.canvasx(0))
 
         if canvas_target != canvas_x:
             self.canvas.xview_scroll(canvas_target - canvas_x, tk.UNITS)
-        if now < self.end_time and not self.paused_at:
-            self.canvas.after(10, self.progress)
+
+        if self.paused_at is not None:
+            return
+        if self.end_bar is not None and bar >= self.end_bar:
+            return
+
+        tempo = self.tempo_map.tempo_at(pos / self.exercise.bar_duration)
+        if tempo != self.shown_tempo:
+            self.tempo_l["text"] = "♩ = {:.0f}".format(tempo)
+            self.shown_tempo = tempo
+        pixel_time = self.exercise.bar_duration / (tempo * BAR_LENGTH)
+        interval = max(1.0 / self.frame_rate, pixel_time)
+        self.next_frame += interval
+        if self.next_frame < now:
+            self.next_frame = now + interval
+        delay = max(1, int((self.next_frame - now) * 1000 + 0.5))
+        self.frame_after = self.after(delay, self.progress)
 
     def new_exercise(self, _event=None):
         """Generate new exercise."""
         if self.player:
             self.player.stop()
+        self.cancel_updates()
         if self.scale_mode_v:
             mode = self.scale_mode_v.get()
         else:
@@ -600,7 +949,11 @@ class CEPApplication(tk.Frame):
         else:
             harmonization = "triads"
         if self.length_v:
-            length = int(self.length_v.get().split(" ", 1)[0])
+            length = self.length_v.get()
+            if length == ENDLESS:
+                length = None
+            else:
+                length = int(length.split(" ", 1)[0])
         else:
             length = DEFAULT_LENGTH
         if self.progression_v:
@@ -609,40 +962,81 @@ class CEPApplication(tk.Frame):
                 progression = None
         else:
             progression = None
+        if progression:
+            self.period = len(PROGRESSIONS[progression])
+        else:
+            self.period = ACCELERANDO_PERIOD
         self.exercise = Exercise(root=root,
                                  mode=mode,
                                  harmonization=harmonization,
                                  length=length,
                                  progression=progression)
+        print("The scale is:", self.exercise.scale_name)
+        if self.exercise.length is None:
+            print("The progression is endless")
+        else:
+            roman_numbers = [ROMAN[x] for x in self.exercise.progression]
+            print("The progression is: {}".format(",".join(roman_numbers)))
         self.start_time = None
-        self.end_time = None
-        self.bar = None
-        self.beat = None
         self.canvas.xview_moveto(0)
         self.chord_d_l["text"] = "–"
         self.chord_n_l["text"] = "–"
         self.n_chord_d_l["text"] = "–"
         self.n_chord_n_l["text"] = "–"
         self.scale_l["text"] = self.exercise.scale_name
+        self.set_listener_key()
+        self.set_end_bar()
         self.draw_canvas()
         self.play_b["text"] = "Play"
 
+def parse_args():
+    """Parse command line arguments."""
+    parser = argparse.ArgumentParser(description="Chord Exercise Partner")
+    parser.add_argument("--stats", metavar="FILE",
+                        help="append player timing statistics of every"
+                             " playback to FILE (as JSON lines)")
+    parser.add_argument("--realtime", action="store_true",
+                        help="run the MIDI player with real-time priority"
+                             " (where permitted) and less jitter")
+    parser.add_argument("--engine", choices=ENGINES,
+                        default="thread",
+                        help="MIDI player implementation (default: %(default)s)")
+    parser.add_argument("--midi-input", metavar="PORT",
+                        help="recognize chords played on this MIDI input"
+                             " port (number, name or '{}' for a new virtual"
+                             " port)".format(VIRTUAL_INPUT))
+    parser.add_argument("--frame-rate", type=int, default=DEFAULT_FRAME_RATE,
+                        help="display refresh rate, in Hz, to pace the"
+                             " score scrolling (default: %(default)s)")
+    # ignore unknown options, as platform launchers may add some
+    args, _ = parser.parse_known_args()
+    return args
+
 def main():
     """Main entry point."""
-    time_res = check_time_resolution()
+    args = parse_args()
+    calibration = Calibration().get()
+    time_res = calibration.time_resolution
     print("Detected time measurement resolution: {:0.6f} ms"
           .format(time_res * 1000))
     if time_res > 0.020:
         print("WARNING: inadequate time measurement resolution!")
-    time_res = check_time_resolution(time.perf_counter)
+    time_res = calibration.precise_time_resolution
     print("Detected precise time measurement resolution: {:0.6f} ms"
           .format(time_res * 1000))
     if time_res > 0.001:
         print("WARNING: inadequate precise time measurement resolution!")
-    sleep_prec = check_sleep_precision()
+    sleep_prec = calibration.sleep_precision
+    print("Detected thread sleep precision: {:0.6f} ms"
+          .format(sleep_prec * 1000))
     if sleep_prec > 0.010:
         print("WARNING: inadequate thread sleep time precision!")
     root_w = tk.Tk()
     root_w.title("Chord Exercise Partner")
-    app = CEPApplication(master=root_w)
+    player_options = {"stats_file": args.stats, "realtime": args.realtime,
+                      "engine": args.engine, "input_port": args.midi_input}
+    app = CEPApplication(master=root_w,
+                         calibration=calibration,
+                         player_options=player_options,
+                         frame_rate=args.frame_rate)
     app.mainloop()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""Wait strategies for the player thread.
+
+A wait strategy waits until an absolute deadline (a time.perf_counter()
+timestamp) or until woken up by another thread, which sets the wake-up
+event (a threading.Event). The waiting thread is responsible for
+clearing the event, after handling what it was woken for.
+"""
+
+import ctypes
+import ctypes.util
+import sys
+import time
+
+# longest sleep without checking for wake-up
+SLEEP_SLICE = 0.002  # seconds
+
+# the spin window is this many times the measured sleep error
+SPIN_FACTOR = 2.0
+MAX_SPIN = 0.020  # seconds
+
+# sleep precision considered good enough for a plain condition wait
+GOOD_PRECISION = 0.0005  # seconds
+
+class ConditionWait:
+    """Wait on the wake-up event with a relative timeout."""
+    name = "condition"
+
+    def __init__(self, event):
+        self.event = event
+
+    def wait_until(self, deadline):
+        """Wait until the deadline or wake()."""
+        timeout = deadline - time.perf_counter()
+        if timeout > 0:
+            self.event.wait(timeout)
+
+    def wake(self):
+        """Wake up the waiting thread."""
+        self.event.set()
+
+class SleepWait(ConditionWait):
+    """Wait with time.sleep(), in short slices to notice wake()."""
+    name = "sleep"
+
+    def _sleep(self, deadline):
+        """Sleep no longer than SLEEP_SLICE and not past the deadline."""
+        timeout = deadline - time.perf_counter()
+        if timeout > 0:
+            time.sleep(min(timeout, SLEEP_SLICE))
+
+    def wait_until(self, deadline):
+        is_set = self.event.is_set
+        while not is_set() and time.perf_counter() < deadline:
+            self._sleep(deadline)
+
+class HybridWait(ConditionWait):
+    """Wait on the condition variable, then spin for the last moment.
+
+    The spin window should be a bit longer than the expected oversleep.
+    """
+    name = "hybrid"
+
+    def __init__(self, event, spin_window=0.002):
+        super().__init__(event)
+        self.spin_window = spin_window
+
+    def wait_until(self, deadline):
+        timeout = deadline - self.spin_window - time.perf_counter()
+        if timeout > 0 and self.event.wait(timeout):
+            return
+        is_set = self.event.is_set
+        while not is_set() and time.perf_counter() < deadline:
+            pass
+
+class _Timespec(ctypes.Structure):
+    # pylint: disable=too-few-public-methods
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+CLOCK_MONOTONIC = 1
+TIMER_ABSTIME = 1
+
+def _load_clock_nanosleep():
+    """Return libc clock_nanosleep() if usable with perf_counter() times."""
+    if not sys.platform.startswith("linux"):
+        return None
+    info = time.get_clock_info("perf_counter")
+    if info.implementation != "clock_gettime(CLOCK_MONOTONIC)":
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6",
+                           use_errno=True)
+        func = libc.clock_nanosleep
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_int,
+                     ctypes.POINTER(_Timespec), ctypes.POINTER(_Timespec)]
+    func.restype = ctypes.c_int
+    return func
+
+_clock_nanosleep = _load_clock_nanosleep() # pylint: disable=invalid-name
+
+class AbsoluteWait(SleepWait):
+    """Sleep until an absolute deadline with clock_nanosleep() (Linux).
+
+    Unlike relative timeouts, the time spent between computing and
+    requesting the sleep does not add to the error. Still sleeps in
+    SLEEP_SLICE slices, to notice wake(), so a waiting thread wakes up
+    about 500 times a second.
+    """
+    name = "absolute"
+    available = _clock_nanosleep is not None
+
+    def _sleep(self, deadline):
+        target = min(deadline, time.perf_counter() + SLEEP_SLICE)
+        secs = int(target)
+        tspec = _Timespec(secs, int((target - secs) * 1e9))
+        _clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, tspec, None)
+
+WAIT_STRATEGIES = {
+    ConditionWait.name: ConditionWait,
+    SleepWait.name: SleepWait,
+    HybridWait.name: HybridWait,
+    }
+if AbsoluteWait.available:
+    WAIT_STRATEGIES[AbsoluteWait.name] = AbsoluteWait
+
+def choose_wait_strategy(event, sleep_precision=None, name=None):
+    """Create a wait strategy for the wake-up event.
+
+    When 'name' is not given choose the best one for the given sleep
+    precision, as measured by timing.check_sleep_precision().
+    """
+    if name:
+        strategy = WAIT_STRATEGIES[name]
+    elif sleep_precision is None or sleep_precision <= GOOD_PRECISION:
+        strategy = ConditionWait
+    elif AbsoluteWait.available:
+        strategy = AbsoluteWait
+    else:
+        strategy = HybridWait
+    if strategy is HybridWait:
+        if sleep_precision is None:
+            return HybridWait(event)
+        spin_window = min(sleep_precision * SPIN_FACTOR, MAX_SPIN)
+        return HybridWait(event, spin_window)
+    return strategy(event)
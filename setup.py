@@ -34,7 +34,11 @@ setup(
     entry_points={
         'gui_scripts': [
             "chord_exercise_partner = jajcus.chord_exercise_partner.ui:main",
-        ]
+        ],
+        'console_scripts': [
+            "chord_exercise_batch = jajcus.chord_exercise_partner.batch:main",
+            "chord_exercise_server = jajcus.chord_exercise_partner.server:main",
+        ],
     },
     python_requires=">=3.4",
     extras_require={
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+"""Backing track player benchmarks.
+
+Measures rendering speed of all the backing tracks for various exercise
+lengths and real-time playback quality into a fake MIDI port, without
+rtmidi or any MIDI device. Playback is measured for the threaded player
+with each wait strategy and for the asyncio player (on Python 3.5.2 or
+newer). Results are printed (or written) as JSON, so runs can be
+compared.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from chord_exercise_partner.backends import FakeBackend
+from chord_exercise_partner.exercise import LEAD_IN, Exercise
+from chord_exercise_partner.optimize import optimize_stream
+from chord_exercise_partner.player import CompPlayer
+from chord_exercise_partner.render import stream_events
+from chord_exercise_partner.tempo import TempoClock, TempoMap
+from chord_exercise_partner.tracks import MAIN_TRACKS
+from chord_exercise_partner.wait import WAIT_STRATEGIES
+
+RENDER_LENGTHS = [10, 60, 600]
+PLAYBACK_BARS = 8
+PLAYBACK_TEMPO = 240
+PLAYBACK_TRACK = "straight + chords"
+
+def make_exercise(length):
+    """Create a reproducible exercise."""
+    return Exercise(length=length, root="C", progression="circle")
+
+def best_time(func, repeats):
+    """Return the shortest run time of func() and its last result."""
+    best = None
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        duration = time.perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+    return best, result
+
+def bench_render(repeats):
+    """Measure CompPlayer.prepare_track() and stream_events() speed."""
+    player = CompPlayer(backend=FakeBackend())
+    results = []
+    for length in RENDER_LENGTHS:
+        exercise = make_exercise(length)
+        player.exercise = exercise
+        player.clock = TempoClock(TempoMap(exercise.bar_duration, 120), 0.0)
+        for track_name, track in MAIN_TRACKS.items():
+            duration, events = best_time(
+                lambda: player.prepare_track(track, length, LEAD_IN), # pylint: disable=cell-var-from-loop
+                repeats)
+            s_duration, count = best_time(
+                lambda: sum(len(chunk) for chunk in stream_events(exercise, track_name)), # pylint: disable=cell-var-from-loop
+                repeats)
+            results.append({
+                "bars": length,
+                "track": track_name,
+                "events": len(events),
+                "prepare_track_s": duration,
+                "prepare_track_events_per_s": len(events) / duration,
+                "stream_s": s_duration,
+                "stream_events_per_s": count / s_duration,
+                })
+    player.quit = True
+    return results
+
+def expected_times(player, exercise, bursts):
+    """Return scheduled times of all events of a finished playback."""
+    stream = optimize_stream(stream_events(exercise, PLAYBACK_TRACK), bursts)
+    return [player.clock.time_at(pos) for chunk in stream for pos, _ in chunk]
+
+ENGINES = ["asyncio", "thread"]
+
+# the asyncio player (async def, loop.create_future()) needs that
+ASYNCIO_MIN_VERSION = (3, 5, 2)
+
+def player_class(engine):
+    """Return the player class of an engine, importing it when needed."""
+    if engine == "asyncio":
+        # a syntax error on older Pythons
+        from chord_exercise_partner.aioplayer import AsyncCompPlayer
+        return AsyncCompPlayer
+    return CompPlayer
+
+def bench_playback(engine, wait_strategy, bars, tempo, realtime=False,
+                   bursts=False):
+    """Play an exercise in real time into a fake port, measure timing."""
+    # pylint: disable=too-many-arguments
+    backend = FakeBackend(bursts=bursts)
+    player = player_class(engine)(backend=backend,
+                                  wait_strategy=wait_strategy,
+                                  realtime=realtime)
+    port = player.port
+    exercise = make_exercise(bars)
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    player.start(exercise, time.time() + 0.1, PLAYBACK_TRACK, tempo)
+    player.wait_idle()
+    wall_time = time.perf_counter() - wall_start
+    cpu_time = time.process_time() - cpu_start
+    expected = expected_times(player, exercise, bursts)
+    stats = player.get_stats()
+    player.quit = True
+
+    sent = [t for t, message in port.messages[1:]] # skip MIDI_INIT
+    lateness = [s - e for s, e in zip(sent, expected)]
+    if len(lateness) > 1:
+        jitter = statistics.pstdev(lateness)
+    else:
+        jitter = None
+    return {
+        "engine": engine,
+        "wait_strategy": player.waiter.name,
+        "bars": bars,
+        "tempo": tempo,
+        "bursts": bursts,
+        "events_expected": len(expected),
+        "events_sent": len(sent),
+        "events_per_s": len(sent) / wall_time,
+        "wall_time_s": wall_time,
+        "cpu_time_s": cpu_time,
+        "cpu_use": cpu_time / wall_time,
+        "lateness_mean_s": statistics.mean(lateness) if lateness else None,
+        "lateness_max_s": max(lateness) if lateness else None,
+        "jitter_s": jitter,
+        "player_stats": stats,
+        "realtime": {measure: description if applied else None
+                     for measure, (applied, description)
+                     in player.realtime_status.items()},
+        }
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="render benchmark repeats")
+    parser.add_argument("--bars", type=int, default=PLAYBACK_BARS,
+                        help="playback benchmark exercise length")
+    parser.add_argument("--tempo", type=int, default=PLAYBACK_TEMPO,
+                        help="playback benchmark tempo")
+    parser.add_argument("--wait-strategy", action="append",
+                        choices=sorted(WAIT_STRATEGIES),
+                        help="wait strategy to test (default: all)")
+    parser.add_argument("--engine", action="append", choices=ENGINES,
+                        help="player engine to test (default: all"
+                        " available)")
+    parser.add_argument("--realtime", action="store_true",
+                        help="play with the player real-time mode")
+    parser.add_argument("--bursts", action="store_true",
+                        help="send events of the same time in bursts")
+    parser.add_argument("--no-playback", action="store_true",
+                        help="skip real-time playback benchmarks")
+    parser.add_argument("--output", metavar="FILE",
+                        help="write results to FILE instead of stdout")
+    args = parser.parse_args()
+    asyncio_available = sys.version_info >= ASYNCIO_MIN_VERSION
+    if args.engine and "asyncio" in args.engine and not asyncio_available:
+        parser.error("the asyncio engine requires Python {} or newer"
+                     .format(".".join(str(i) for i in ASYNCIO_MIN_VERSION)))
+
+    # keep progress messages away from the results
+    real_stdout = sys.stdout
+    sys.stdout = sys.stderr
+
+    results = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "render": bench_render(args.repeats),
+        "playback": [],
+        }
+    if not args.no_playback:
+        if args.engine:
+            engines = args.engine
+        elif asyncio_available:
+            engines = ENGINES
+        else:
+            engines = ["thread"]
+        if "thread" in engines:
+            for name in args.wait_strategy or sorted(WAIT_STRATEGIES):
+                results["playback"].append(bench_playback("thread", name,
+                                                          args.bars, args.tempo,
+                                                          args.realtime,
+                                                          args.bursts))
+        if "asyncio" in engines:
+            results["playback"].append(bench_playback("asyncio", None,
+                                                      args.bars, args.tempo,
+                                                      args.realtime,
+                                                      args.bursts))
+
+    sys.stdout = real_stdout
+    if args.output:
+        with open(args.output, "wt") as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+"""Measure Chord Exercise Partner start-up time.
+
+Reports (as JSON) the time needed to import the UI module and the time
+to the first frame of the main window, each measured in a fresh
+interpreter. Fails when any of the limits is exceeded or when rtmidi is
+imported together with the UI.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+TOP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+IMPORT_CODE = """
+import json
+import sys
+import time
+start = time.perf_counter()
+import chord_exercise_partner.ui
+print(json.dumps({"time": time.perf_counter() - start,
+                  "rtmidi": "rtmidi" in sys.modules}))
+"""
+
+FIRST_FRAME_CODE = """
+import json
+import time
+start = time.perf_counter()
+import tkinter as tk
+from chord_exercise_partner.timing import Calibration
+from chord_exercise_partner.ui import CEPApplication
+calibration = Calibration("/nonexistent")
+calibration.sleep_precision = 0.0001
+root_w = tk.Tk()
+app = CEPApplication(master=root_w, calibration=calibration)
+root_w.update()
+print(json.dumps({"time": time.perf_counter() - start}))
+root_w.destroy()
+"""
+
+def run_python(code):
+    """Run code in a fresh interpreter, return its JSON result or None."""
+    # not subprocess.run(), missing in Python 3.4
+    process = subprocess.Popen([sys.executable, "-c", code],
+                               cwd=TOP_DIR,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               universal_newlines=True)
+    stdout, _ = process.communicate()
+    if process.returncode:
+        return None
+    return json.loads(stdout.strip().split("\n")[-1])
+
+def measure(code, repeats):
+    """Run code repeatedly, return the median time and the last result."""
+    times = []
+    result = None
+    for _ in range(repeats):
+        result = run_python(code)
+        if result is None:
+            return None, None
+        times.append(result["time"])
+    return statistics.median(times), result
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warn-import-ms", type=float, default=150.0)
+    # loose, shared CI workers may be much slower
+    parser.add_argument("--max-import-ms", type=float, default=1000.0)
+    parser.add_argument("--max-first-frame-ms", type=float, default=1000.0)
+    args = parser.parse_args()
+
+    import_time, result = measure(IMPORT_CODE, args.repeats)
+    if import_time is None:
+        print("Could not import chord_exercise_partner.ui")
+        sys.exit(1)
+    imports_rtmidi = result["rtmidi"]
+    first_frame, _ = measure(FIRST_FRAME_CODE, args.repeats)
+
+    report = {
+        "import_ms": import_time * 1000,
+        "imports_rtmidi": imports_rtmidi,
+        "first_frame_ms": first_frame * 1000 if first_frame is not None else None,
+        }
+    print(json.dumps(report, indent=2))
+
+    failed = False
+    if imports_rtmidi:
+        print("rtmidi imported together with the UI!")
+        failed = True
+    if report["import_ms"] > args.max_import_ms:
+        print("Import takes too long!")
+        failed = True
+    elif report["import_ms"] > args.warn_import_ms:
+        print("Warning: import takes longer than {:g} ms"
+              .format(args.warn_import_ms))
+    if first_frame is None:
+        print("Could not show the window, first frame time not measured")
+    elif report["first_frame_ms"] > args.max_first_frame_ms:
+        print("First frame takes too long!")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+"""Check that the player event queue dispatch cost does not grow with
+the exercise length."""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from chord_exercise_partner.events import EventQueue
+from chord_exercise_partner.exercise import Exercise
+from chord_exercise_partner.render import stream_events
+
+LENGTHS = [10, 100, 1000]
+REPEATS = 5
+MAX_RATIO = 2.0
+
+def dispatch_cost(length):
+    """Return time per event of emptying a queue of a whole exercise."""
+    exercise = Exercise(length=length, progression="circle")
+    best = None
+    for _ in range(REPEATS):
+        queue = EventQueue()
+        for chunk in stream_events(exercise, "straight + chords"):
+            queue.extend(chunk)
+        count = len(queue)
+        start = time.perf_counter()
+        while queue:
+            queue.next_time()
+            queue.pop()
+        cost = (time.perf_counter() - start) / count
+        if best is None or cost < best:
+            best = cost
+    return best
+
+def main():
+    """Main entry point."""
+    costs = []
+    for length in LENGTHS:
+        cost = dispatch_cost(length)
+        print("{:5} bars: {:8.3f} µs per event".format(length, cost * 1e6))
+        costs.append(cost)
+    ratio = costs[-1] / costs[0]
+    print("Cost ratio {} bars / {} bars: {:.2f}"
+          .format(LENGTHS[-1], LENGTHS[0], ratio))
+    if ratio > MAX_RATIO:
+        print("Dispatch cost grows with exercise length!")
+        sys.exit(1)
+    print("Dispatch cost OK! :-)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+"""Check that chords played on a (fake) MIDI input are recognized,
+in any voicing, quickly after the last note-on."""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from chord_exercise_partner.backends import FakeBackend
+from chord_exercise_partner.exercise import Exercise
+from chord_exercise_partner.listener import open_listener
+from chord_exercise_partner.midi import MIDDLE_C, note_off, note_on
+from chord_exercise_partner.notes import scale_uses_flats
+
+MAX_DELAY = 0.005 # seconds
+
+def main():
+    """Main entry point."""
+    exercise = Exercise(length=8, root="D", progression="circle",
+                        harmonization="7ths")
+    results = []
+    reported = threading.Event()
+    def on_match(result):
+        results.append(result)
+        reported.set()
+    expected = [None]
+    listener = open_listener(FakeBackend(), 0, lambda when: expected[0],
+                             on_match)
+    listener.use_flats = scale_uses_flats(exercise.root, exercise.mode)
+    port = listener.port
+    failed = False
+    for ex_bar in range(exercise.length):
+        chord = exercise.chords[exercise.progression[ex_bar]]
+        expected[0] = chord
+        # the chord in a different inversion every bar
+        notes = list(chord.notes)
+        for _ in range(ex_bar % len(notes)):
+            notes.append(notes.pop(0) + 12)
+        for note in notes:
+            reported.clear()
+            port.play(note_on(1, MIDDLE_C + note, 0.8))
+            reported.wait(1.0)
+        result = results[-1]
+        print("{:8} played as {:8} match: {}, delay {:.3f} ms"
+              .format(chord.name, str(result.chord), result.match,
+                      result.delay * 1000))
+        if (not result.match or result.chord != chord.name
+                or result.delay > MAX_DELAY):
+            failed = True
+        for note in notes:
+            port.play(note_off(1, MIDDLE_C + note))
+    listener.close()
+    if failed:
+        print("Chord recognition failed or too slow!")
+        sys.exit(1)
+    print("Chord recognition OK! :-)")
+
+if __name__ == "__main__":
+    main()
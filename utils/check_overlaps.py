@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+"""Check that a note started again while still sounding ends at its own
+time, not at the note-off of the note it cut."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from chord_exercise_partner.exercise import LEAD_IN, Exercise
+from chord_exercise_partner.optimize import optimize_stream
+from chord_exercise_partner.render import stream_events
+from chord_exercise_partner.tracks import CH_PIANO, MAIN_TRACKS
+
+NOTE = 60
+TRACK = "overlap check"
+
+def note(duration):
+    """Return the checked note, as in a track pattern."""
+    return [(CH_PIANO, NOTE, 0.8, duration)]
+
+# name, pattern, expected (position, note on) events (in bars from the
+# exercise start)
+CASES = [
+    ("nested", [[(0.0, note(1.0)), (0.5, note(0.25))]],
+     [(0.0, True), (0.5, False), (0.5, True), (0.75, False)]),
+    ("extending", [[(0.0, note(0.75)), (0.5, note(0.5))]],
+     [(0.0, True), (0.5, False), (0.5, True), (1.0, False)]),
+    ("same start", [[(0.0, note(1.0)), (0.0, note(0.5))]],
+     [(0.0, True), (1.0, False)]),
+    ("three", [[(0.0, note(1.0)), (0.5, note(0.25)), (0.875, note(0.125))]],
+     [(0.0, True), (0.5, False), (0.5, True), (0.75, False),
+      (0.875, True), (1.0, False)]),
+    ("across bars", [[(0.75, note(0.5))], [(0.0, note(0.125))]],
+     [(0.75, True), (1.0, False), (1.0, True), (1.125, False)]),
+    ]
+
+def played(pattern):
+    """Return (position, note on) events of the checked note."""
+    MAIN_TRACKS[TRACK] = pattern
+    try:
+        exercise = Exercise(length=len(pattern), root="C")
+        stream = optimize_stream(stream_events(exercise, TRACK))
+        result = []
+        for chunk in stream:
+            for pos, message in chunk:
+                if message[0] & 0x0f != CH_PIANO - 1 or message[1] != NOTE:
+                    continue
+                kind = message[0] & 0xf0
+                if kind in (0x80, 0x90):
+                    result.append((pos - LEAD_IN, kind == 0x90 and message[2] > 0))
+        return result
+    finally:
+        del MAIN_TRACKS[TRACK]
+
+def main():
+    """Main entry point."""
+    failed = False
+    for name, pattern, expected in CASES:
+        result = played(pattern)
+        if result == expected:
+            print("{}: OK".format(name))
+        else:
+            print("{}: got {}, expected {}".format(name, result, expected))
+            failed = True
+    if failed:
+        print("Overlapping notes played wrong!")
+        sys.exit(1)
+    print("Overlapping notes OK! :-)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""Check that the exercises of a playlist are joined into a single
+event stream, also when the stream is restarted in a later exercise."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position,protected-access
+from chord_exercise_partner.backends import FakeBackend
+from chord_exercise_partner.exercise import LEAD_IN, Exercise
+from chord_exercise_partner.optimize import DRUM_CHANNEL
+from chord_exercise_partner.player import CompPlayer
+from chord_exercise_partner.render import stream_events
+from chord_exercise_partner.tempo import TempoClock, TempoMap
+
+TRACK = "straight + chords"
+
+def make_exercises():
+    """Return the exercises of the test playlist."""
+    return [Exercise(length=4, root="C", progression="circle"),
+            Exercise(length=3, root="E", progression="circle"),
+            Exercise(length=5, root="G", harmonization="7ths",
+                     progression="circle")]
+
+def check_events(chunks, skip_drums=False):
+    """Check the events of a stream, return list of problems found."""
+    problems = []
+    last_pos = None
+    sounding = {}
+    for chunk in chunks:
+        for pos, message in chunk:
+            if last_pos is not None and pos < last_pos:
+                problems.append("event at {} after {}".format(pos, last_pos))
+            last_pos = pos
+            kind = message[0] & 0xf0
+            channel = message[0] & 0x0f
+            if kind not in (0x80, 0x90):
+                continue
+            if skip_drums and channel == DRUM_CHANNEL:
+                continue
+            key = (channel, message[1])
+            if kind == 0x90 and message[2]:
+                sounding[key] = sounding.get(key, 0) + 1
+            elif sounding.get(key):
+                sounding[key] -= 1
+            else:
+                problems.append("unexpected note-off {} at {}"
+                                .format(message, pos))
+    stuck = [key for key, count in sounding.items() if count]
+    if stuck:
+        problems.append("notes never stopped: {}".format(stuck))
+    return problems
+
+def check_join():
+    """Check stream_events() with 'next_exercise', return problems found."""
+    exercises = make_exercises()
+    queue = exercises[1:]
+    calls = []
+    def next_exercise(song_bar):
+        calls.append(song_bar)
+        return queue.pop(0) if queue else None
+    chunks = list(stream_events(exercises[0], TRACK,
+                                next_exercise=next_exercise))
+    problems = check_events(chunks)
+    expected = []
+    end_bar = LEAD_IN
+    for exercise in exercises:
+        end_bar += exercise.length
+        expected.append(end_bar)
+    if calls != expected:
+        problems.append("next_exercise() called at {}, expected {}"
+                        .format(calls, expected))
+    if len(chunks) != end_bar + 1:
+        problems.append("{} chunks for {} bars".format(len(chunks), end_bar))
+    for song_bar, chunk in enumerate(chunks[:end_bar]):
+        if any(not song_bar <= pos < song_bar + 1 for pos, _ in chunk):
+            problems.append("bar {} events out of the bar".format(song_bar))
+    return problems
+
+def make_player(exercises):
+    """Return a thread-less player, as after the first exercise start."""
+    player = CompPlayer.__new__(CompPlayer)
+    player._init_state(None, None, False)
+    player.backend = FakeBackend()
+    player.exercise = exercises[0]
+    player.parts = [(LEAD_IN, exercises[0])]
+    player.playlist.extend(exercises[1:])
+    player.track_name = TRACK
+    player.clock = TempoClock(TempoMap(exercises[0].bar_duration, 120), 0.0)
+    return player
+
+def check_resume():
+    """Check restarting the player stream, return problems found."""
+    problems = []
+    exercises = make_exercises()
+    starts = [LEAD_IN, LEAD_IN + 4, LEAD_IN + 7]
+    player = make_player(exercises)
+    # resumed in the second exercise, before the first one was streamed
+    song_bar = starts[1] + 1
+    chunks = list(player._start_stream(player.clock.time_at(song_bar + 1.5)))
+    first = min(pos for chunk in chunks for pos, _ in chunk)
+    if first < song_bar:
+        problems.append("resumed stream starts at {}, expected {}"
+                        .format(first, song_bar))
+    problems += check_events(chunks, skip_drums=True)
+    parts = [(start, exercise) for start, exercise in zip(starts, exercises)]
+    if player.parts != parts or player.playlist:
+        problems.append("wrong parts after resuming: {}".format(player.parts))
+    # restarted in the first exercise: the same parts, nothing more queued
+    chunks = list(player._start_stream(player.clock.time_at(LEAD_IN + 2.5)))
+    problems += check_events(chunks, skip_drums=True)
+    if player.parts != parts:
+        problems.append("wrong parts after restarting: {}"
+                        .format(player.parts))
+    # the loop mode repeats the last exercise
+    player = make_player(exercises[:1])
+    player.looping = True
+    stream = player._start_stream(player.clock.time_at(LEAD_IN + 5.5))
+    next(stream)
+    if player.parts != [(LEAD_IN, exercises[0]), (LEAD_IN + 4, exercises[0])]:
+        problems.append("wrong parts in the loop mode: {}"
+                        .format(player.parts))
+    return problems
+
+def main():
+    """Main entry point."""
+    failed = False
+    for name, check in (("join", check_join), ("resume", check_resume)):
+        problems = check()
+        for problem in problems:
+            print("{}: {}".format(name, problem))
+        if problems:
+            failed = True
+        else:
+            print("{}: OK".format(name))
+    if failed:
+        print("Playlist streams broken!")
+        sys.exit(1)
+    print("Playlist streams OK! :-)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+"""Check that the session server plays many sessions from a single
+thread, into fake MIDI ports."""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+# pylint: disable=wrong-import-position
+from chord_exercise_partner.backends import FakeBackend
+from chord_exercise_partner.exercise import Exercise
+from chord_exercise_partner.optimize import optimize_stream
+from chord_exercise_partner.render import stream_events
+from chord_exercise_partner.server import SessionServer
+
+SESSIONS = 12
+BARS = 2
+TEMPO = 480
+TRACK = "straight + chords"
+
+def main():
+    """Main entry point."""
+    threads_before = threading.active_count()
+    server = SessionServer(FakeBackend(bursts=True))
+    start_time = time.time() + 0.2
+    sessions = []
+    for i in range(SESSIONS):
+        session = server.open_session()
+        exercise = Exercise(length=BARS, root=i % 12, progression="circle")
+        session.start(exercise, start_time, TRACK, TEMPO)
+        sessions.append((session, session.port, exercise))
+    threads = threading.active_count() - threads_before
+    failed = False
+    for session, port, exercise in sessions:
+        session.wait_idle()
+        stream = optimize_stream(stream_events(exercise, TRACK), True)
+        expected = sum(len(chunk) for chunk in stream)
+        stats = session.get_stats()
+        sent = len(port.messages) - 1 # MIDI_INIT
+        print("Session {}: {} of {} events sent, max lateness {:.3f} ms"
+              .format(session.name, sent, expected,
+                      (stats["lateness"]["max"] or 0) * 1000))
+        if sent + stats["dropped"] != expected:
+            failed = True
+    server.stop()
+    print("Server threads: {}".format(threads))
+    if threads != 1:
+        print("Sessions should share a single thread!")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("Session server OK! :-)")
+
+if __name__ == "__main__":
+    main()